@@ -0,0 +1,160 @@
+"""Sales statistics from pre-aggregated daily counters.
+
+Orders are counted in one bucket document per (day, plan): orders created
+on the day they were created, and orders confirmed with their revenue and
+counts per currency code on the day they were confirmed. Live counters so
+only ever touch the current day's buckets. Handlers only bump in-memory
+counters; a background task folds them into the buckets with ``$inc``
+upserts, so a dashboard load reads a few dozen small documents instead of
+aggregating over ``orders``. Counters buffered when a worker dies are lost;
+``backfill_stats.py`` rebuilds past days' buckets from the orders themselves.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from pricing import currency_code
+
+
+STATS_COLLECTION = "daily_stats"
+
+
+def bucket_day(created_at):
+    return created_at.strftime("%Y-%m-%d")
+
+
+def bucket_id(day, plan_id):
+    return f"{day}:{plan_id}"
+
+
+class SalesCounters:
+    def __init__(self, collection, flush_interval=1.0):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        # bucket id -> {"fields": ..., "inc": {counter: amount}}
+        self._pending = {}
+        self._task = None
+        self._breaker = None
+        self._closing = False
+
+    def _add(self, order, at, increments):
+        day = bucket_day(at)
+        key = bucket_id(day, order["planId"])
+        bucket = self._pending.get(key)
+        if bucket is None:
+            bucket = self._pending[key] = {
+                "fields": {"day": day, "planId": order["planId"], "planName": order["planName"]},
+                "inc": defaultdict(int)
+            }
+        for counter, amount in increments.items():
+            bucket["inc"][counter] += amount
+
+    def order_created(self, order):
+        self._add(order, order["createdAt"], {"ordersCreated": 1})
+
+    def order_confirmed(self, order, confirmed_at):
+        code = currency_code(order["currency"])
+        self._add(order, confirmed_at, {
+            "ordersConfirmed": 1,
+            f"revenue.{code}": order["amount"],
+            f"confirmedByCurrency.{code}": 1
+        })
+
+    def start(self, breaker):
+        self._breaker = breaker
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            # The flag stops the loop even if wait_for swallows the cancellation
+            self._closing = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"_id": key},
+                {"$inc": dict(bucket["inc"]), "$set": {**bucket["fields"], "updatedAt": now}},
+                upsert=True
+            )
+            for key, bucket in pending.items()
+        ]
+        try:
+            await self._breaker.call(lambda: self.collection.bulk_write(operations, ordered=False), 10.0)
+        except Exception as e:
+            # Keep the counts for the next flush
+            logging.error("Error flushing sales counters for %s buckets: %s", len(pending), e)
+            for key, bucket in pending.items():
+                current = self._pending.setdefault(key, {"fields": bucket["fields"], "inc": defaultdict(int)})
+                for counter, amount in bucket["inc"].items():
+                    current["inc"][counter] += amount
+
+    async def _run(self):
+        while not self._closing:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+def _conversion_rate(created, confirmed):
+    return round(confirmed / created, 4) if created else None
+
+
+def _add_totals(totals, bucket):
+    totals["ordersCreated"] += bucket.get("ordersCreated", 0)
+    totals["ordersConfirmed"] += bucket.get("ordersConfirmed", 0)
+    for code, amount in bucket.get("revenue", {}).items():
+        totals["revenue"][code] = totals["revenue"].get(code, 0) + amount
+    for code, count in bucket.get("confirmedByCurrency", {}).items():
+        totals["confirmedByCurrency"][code] = totals["confirmedByCurrency"].get(code, 0) + count
+
+
+def _new_totals():
+    return {"ordersCreated": 0, "ordersConfirmed": 0, "revenue": {}, "confirmedByCurrency": {}}
+
+
+def _finish(totals):
+    totals["revenue"] = {code: round(amount, 2) for code, amount in totals["revenue"].items()}
+    totals["conversionRate"] = _conversion_rate(totals["ordersCreated"], totals["ordersConfirmed"])
+    return totals
+
+
+async def get_sales_stats(collection, start_day, end_day):
+    """Totals, per-plan totals and per-plan daily rows for days in [start_day, end_day]."""
+    cursor = collection.find({"day": {"$gte": start_day, "$lte": end_day}}).sort([("day", 1), ("planId", 1)])
+    buckets = await cursor.to_list(length=None)
+
+    totals = _new_totals()
+    by_plan = {}
+    daily = []
+    for bucket in buckets:
+        _add_totals(totals, bucket)
+        plan = by_plan.setdefault(bucket["planId"], {"planId": bucket["planId"], **_new_totals()})
+        plan["planName"] = bucket.get("planName")
+        _add_totals(plan, bucket)
+
+        row = _new_totals()
+        _add_totals(row, bucket)
+        daily.append({"day": bucket["day"], "planId": bucket["planId"], "planName": bucket.get("planName"), **_finish(row)})
+
+    return {
+        "from": start_day,
+        "to": end_day,
+        "totals": _finish(totals),
+        "byPlan": [_finish(plan) for plan in by_plan.values()],
+        "daily": daily
+    }
@@ -0,0 +1,87 @@
+"""Buffered download audit trail.
+
+Download events are queued in memory and written to MongoDB in
+``insert_many`` batches by a single background task, so serving a file
+never waits on an audit insert.
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+
+
+AUDIT_COLLECTION = "download_audit"
+# Capped so the audit trail never grows without bound (256 MB)
+AUDIT_COLLECTION_SIZE = 256 * 1024 * 1024
+
+
+class DownloadAuditWriter:
+    def __init__(self, collection, batch_size=200, flush_interval=1.0, max_pending=10000):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Bounded queue: when Mongo falls behind, record() waits instead of
+        # letting the buffer grow until the process runs out of memory.
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self._task = None
+        self._closing = False
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def record(self, order_id, file_name, ip, bytes_sent, duration_ms):
+        await self.queue.put({
+            "orderId": order_id,
+            "fileName": file_name,
+            "ip": ip,
+            "bytes": bytes_sent,
+            "durationMs": round(duration_ms, 2),
+            "timestamp": datetime.utcnow()
+        })
+
+    async def close(self):
+        """Stop the background flusher once everything buffered is written."""
+        self._closing = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+        while not self.queue.empty():
+            await self._flush(self._drain([]))
+
+    def _drain(self, batch):
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except Exception as e:
+            logging.error("Dropped %s download audit events: %s", len(batch), e)
+
+    async def _run(self):
+        while True:
+            try:
+                first = await asyncio.wait_for(self.queue.get(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                if self._closing:
+                    return
+                continue
+            batch = self._drain([first])
+            # Give a burst a moment to fill the batch before paying for a round trip
+            if len(batch) < self.batch_size and not self._closing:
+                await asyncio.sleep(min(self.flush_interval, 0.05))
+                batch = self._drain(batch)
+            await self._flush(batch)
+
+
+async def get_download_events(collection, order_id, limit=100):
+    cursor = collection.find({"orderId": order_id}, {"_id": 0}).sort("timestamp", -1)
+    return await cursor.to_list(length=limit)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Rebuild the daily sales buckets from the orders collection.
+
+Groups orders by (day, plan, currency) in a single aggregation and streams
+the results, so memory stays flat however many orders there are; each
+bucket is then replaced wholesale. Creations count on the day an order was
+created and confirmations on the day it was confirmed (its creation day for
+orders confirmed before ``confirmedAt`` was recorded), as the live counters
+do.
+
+By default it rebuilds every day before today (UTC). The API only ever
+increments the current day's buckets, but workers flush their counters
+every second and hold them back while MongoDB is down: run it a minute or
+more after midnight UTC, and not during an outage, or counts still in
+flight for the previous day are lost or doubled.
+
+    python backfill_stats.py [--since 2024-01-01] [--until 2024-02-01]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+from pymongo import ReplaceOne
+
+from analytics import STATS_COLLECTION, bucket_id
+from pricing import currency_code
+from storage import create_client
+
+
+ROOT_DIR = Path(__file__).parent
+BATCH_SIZE = 500
+
+
+def build_pipeline(since, until):
+    period = {"$lt": until}
+    if since is not None:
+        period["$gte"] = since
+
+    def counted(at, created, confirmed, revenue):
+        return {"$project": {
+            "at": at, "planId": 1, "planName": 1, "currency": 1,
+            "created": {"$literal": created}, "confirmed": {"$literal": confirmed}, "revenue": revenue
+        }}
+
+    # One row per creation and one per confirmation, each on its own day
+    return [
+        {"$match": {"createdAt": period}},
+        counted("$createdAt", 1, 0, {"$literal": 0}),
+        {"$unionWith": {"coll": "orders", "pipeline": [
+            {"$match": {"paymentStatus": "confirmed", "$or": [
+                {"confirmedAt": period},
+                {"confirmedAt": {"$exists": False}, "createdAt": period}
+            ]}},
+            counted({"$ifNull": ["$confirmedAt", "$createdAt"]}, 0, 1, "$amount")
+        ]}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$at"}},
+                # Orders in the oldest schema reference the plan by ObjectId
+                "planId": {"$toString": "$planId"},
+                "currency": "$currency"
+            },
+            "planName": {"$last": "$planName"},
+            "ordersCreated": {"$sum": "$created"},
+            "ordersConfirmed": {"$sum": "$confirmed"},
+            "revenue": {"$sum": "$revenue"}
+        }},
+        # Rows of one bucket arrive together, so they can be folded while streaming
+        {"$sort": {"_id.day": 1, "_id.planId": 1}}
+    ]
+
+
+def new_bucket(day, plan_id, plan_name, now):
+    return {
+        "_id": bucket_id(day, plan_id),
+        "day": day,
+        "planId": plan_id,
+        "planName": plan_name,
+        "ordersCreated": 0,
+        "ordersConfirmed": 0,
+        "revenue": {},
+        "confirmedByCurrency": {},
+        "updatedAt": now
+    }
+
+
+async def backfill(db, since, until):
+    """Replace the buckets for orders created in [since, until); returns the bucket count."""
+    stats = db[STATS_COLLECTION]
+    now = datetime.utcnow()
+    operations = []
+    written = 0
+    bucket = None
+
+    async def write(final=False):
+        nonlocal operations, written
+        if operations and (final or len(operations) >= BATCH_SIZE):
+            await stats.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+
+    cursor = db.orders.aggregate(build_pipeline(since, until), allowDiskUse=True, batchSize=1000)
+    async for row in cursor:
+        key = row["_id"]
+        if bucket is None or bucket["_id"] != bucket_id(key["day"], key["planId"]):
+            if bucket is not None:
+                operations.append(ReplaceOne({"_id": bucket["_id"]}, bucket, upsert=True))
+                await write()
+            bucket = new_bucket(key["day"], key["planId"], row["planName"], now)
+
+        bucket["ordersCreated"] += row["ordersCreated"]
+        bucket["ordersConfirmed"] += row["ordersConfirmed"]
+        if row["ordersConfirmed"]:
+            code = currency_code(key["currency"])
+            bucket["revenue"][code] = bucket["revenue"].get(code, 0) + row["revenue"]
+            bucket["confirmedByCurrency"][code] = bucket["confirmedByCurrency"].get(code, 0) + row["ordersConfirmed"]
+
+    if bucket is not None:
+        operations.append(ReplaceOne({"_id": bucket["_id"]}, bucket, upsert=True))
+    await write(final=True)
+    return written
+
+
+def parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rebuild daily sales buckets from orders")
+    parser.add_argument("--since", type=parse_day, help="first day to rebuild (default: the first order)")
+    parser.add_argument("--until", type=parse_day, help="day to stop before (default: today, UTC)")
+    args = parser.parse_args()
+    until = args.until or parse_day(datetime.utcnow().strftime("%Y-%m-%d"))
+
+    load_dotenv(ROOT_DIR / '.env')
+    client = create_client(os.environ['MONGO_URL'])
+    try:
+        written = await backfill(client[os.environ['DB_NAME']], args.since, until)
+        print(f"✅ Rebuilt {written} daily sales buckets")
+    except Exception as e:
+        print(f"❌ Error backfilling sales stats: {e}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Measure what coupon evaluation adds to order creation.
+
+Builds the API on the in-memory storage backend, then times
+``create_order`` without a coupon, with an unlimited coupon (index lookup
+only) and with a limited one (plus the redemption ``$inc``), and times
+``evaluate_coupon`` on its own. The memory backend has no network round
+trip, so on MongoDB the limited case costs one more query on top of this.
+
+    python bench_coupons.py [--orders 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"{name:<28} p50 {p50:8.1f} µs   p99 {p99:8.1f} µs")
+    return p50
+
+
+async def bench(orders):
+    import server
+    from coupons import evaluate_coupon
+
+    app = server.create_app()
+    await app.router.startup()
+    try:
+        plans = await server.get_catalog("plans")
+        plan = plans[-1]
+        for code, max_uses in (("BENCH", None), ("LIMITED", orders * 10)):
+            await server.create_coupon(server.CouponCreate(code=code, type="percent", value=10, maxUses=max_uses))
+        server.catalog_cache.invalidate("coupons")
+
+        def new_order(coupon_code):
+            return server.OrderCreate(
+                customerEmail="bench@example.com", customerName="Bench", planId=plan["id"], couponCode=coupon_code
+            )
+
+        results = {}
+        for name, coupon_code in (("no coupon", None), ("unlimited coupon", "BENCH"), ("limited coupon", "LIMITED")):
+            samples = []
+            for _ in range(orders):
+                order = new_order(coupon_code)
+                started = time.perf_counter()
+                await server.create_order(order)
+                samples.append((time.perf_counter() - started) * 1e6)
+            results[name] = report(f"create_order, {name}", samples)
+
+        coupon = (await server.get_catalog("coupons"))["BENCH"]
+        now = datetime.utcnow()
+        started = time.perf_counter()
+        for _ in range(orders * 100):
+            evaluate_coupon(coupon, plan, now)
+        per_call = (time.perf_counter() - started) * 1e6 / (orders * 100)
+        print(f"{'evaluate_coupon':<28} mean {per_call:7.2f} µs")
+
+        overhead = results["unlimited coupon"] - results["no coupon"]
+        print(f"\nUnlimited coupon overhead: {overhead:+.1f} µs per order "
+              f"({overhead / results['no coupon'] * 100:+.1f}%)")
+    finally:
+        await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark coupon evaluation in create_order")
+    parser.add_argument("--orders", type=int, default=2000, help="orders per scenario")
+    args = parser.parse_args()
+
+    os.environ['MONGO_URL'] = 'memory://'
+    os.environ.setdefault('DB_NAME', 'bench')
+    os.environ['DATA_DIR'] = tempfile.mkdtemp(prefix='bench-coupons-')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    asyncio.run(bench(args.orders))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Measure how ``GET /api/plans`` throughput scales with gunicorn workers.
+
+Starts gunicorn with 1, 2, 4, ... workers (up to the core count) and drives
+the endpoint from separate client processes over keep-alive connections.
+Plans are served from each worker's catalog cache, so throughput should
+grow close to linearly with workers. The clients share the machine with
+the servers: scaling flattens once workers plus clients exceed the cores.
+
+By default every worker keeps its own in-memory database (MONGO_URL=memory://),
+which is enough for a read-only benchmark; pass --mongo-url to use MongoDB.
+
+    python bench_plans.py [--duration 10] [--workers 1,2,4]
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+ROOT_DIR = Path(__file__).parent
+
+
+def client(port, duration, results):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    requests = errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            connection.request("GET", "/api/plans", headers={"Accept-Encoding": "gzip"})
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+        requests += 1
+    results.put((requests, errors))
+
+
+def wait_until_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/api/plans")
+            if connection.getresponse().status == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server did not answer on port {port} within {timeout}s")
+
+
+def drive(port, clients, duration):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client, args=(port, duration, results)) for _ in range(clients)]
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return sum(requests for requests, _ in totals), sum(errors for _, errors in totals)
+
+
+def bench(workers, args):
+    env = dict(
+        os.environ,
+        BIND=f"127.0.0.1:{args.port}",
+        WEB_CONCURRENCY=str(workers),
+        MONGO_URL=args.mongo_url,
+        DB_NAME=os.environ.get('DB_NAME', 'bench'),
+        DATA_DIR=tempfile.mkdtemp(prefix='bench-plans-'),
+        LOG_LEVEL='WARNING'
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'server:app'],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_ready(args.port)
+        clients = args.clients or 2 * workers
+        # Warms every worker's catalog cache
+        drive(args.port, clients, 1.0)
+        requests, errors = drive(args.port, clients, args.duration)
+    finally:
+        server.terminate()
+        server.wait()
+    return requests / args.duration, errors
+
+
+def main():
+    cores = os.cpu_count() or 1
+    default_workers = sorted({1, *(2 ** n for n in range(1, cores.bit_length()) if 2 ** n <= cores), cores})
+
+    parser = argparse.ArgumentParser(description="Benchmark get_plans throughput against worker count")
+    parser.add_argument("--workers", default=",".join(map(str, default_workers)), help="comma-separated worker counts")
+    parser.add_argument("--clients", type=int, default=0, help="client processes (default: 2 per worker)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per worker count")
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--mongo-url", default="memory://")
+    args = parser.parse_args()
+
+    print(f"{cores} cores")
+    # Throughput per worker of the first run; linear scaling keeps it constant
+    per_worker = None
+    for workers in (int(value) for value in args.workers.split(",")):
+        throughput, errors = bench(workers, args)
+        per_worker = per_worker or throughput / workers
+        print(f"{workers:>3} workers  {throughput:9.0f} req/s  "
+              f"({throughput / (per_worker * workers) * 100:.0f}% of linear, {errors} errors)")
+
+
+if __name__ == "__main__":
+    main()
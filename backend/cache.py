@@ -0,0 +1,141 @@
+"""Per-process catalog cache kept coherent across workers.
+
+Each worker keeps serialized plans and testimonials in memory. The
+invalidation bus drops a worker's copy whenever any process writes to the
+underlying collection: through a MongoDB change stream when the server is
+a replica set, otherwise by polling the small ``cache_versions`` collection
+that writers bump with ``bump_cache_version``. Polling cannot see edits made
+directly in Mongo, so it also reloads everything every CATALOG_MAX_AGE
+seconds; a reload that finds nothing changed keeps the cached objects.
+"""
+
+import asyncio
+import logging
+import time
+
+from pymongo.errors import OperationFailure
+
+
+CACHE_VERSIONS_COLLECTION = "cache_versions"
+POLL_INTERVAL = 0.2
+MAX_AGE = 30.0
+
+
+class CatalogCache:
+    def __init__(self):
+        self._loaders = {}
+        self._values = {}
+        self._locks = {}
+        # Bumped on every invalidation; a load that started before the bump
+        # must not store its (possibly stale) result.
+        self.versions = {}
+        # Values invalidated since they were last loaded
+        self._previous = {}
+        # Called with the name of every invalidated entry
+        self.listeners = []
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+        self._locks[name] = asyncio.Lock()
+        self.versions[name] = 0
+
+    async def get(self, name):
+        if name in self._values:
+            return self._values[name]
+        async with self._locks[name]:
+            if name in self._values:
+                return self._values[name]
+            version = self.versions[name]
+            value = await self._loaders[name]()
+            previous = self._previous.get(name)
+            if previous is not None and value == previous:
+                # Unchanged: keep the object that caches keyed on it already know
+                value = previous
+            if version == self.versions[name]:
+                self._previous.pop(name, None)
+                self._values[name] = value
+            return value
+
+    def invalidate(self, name):
+        if name in self.versions:
+            self.versions[name] += 1
+            value = self._values.pop(name, None)
+            if value is not None:
+                self._previous[name] = value
+            for listener in self.listeners:
+                listener(name)
+
+    def invalidate_all(self):
+        for name in list(self.versions):
+            self.invalidate(name)
+
+
+async def bump_cache_version(db, name):
+    await db[CACHE_VERSIONS_COLLECTION].update_one({"_id": name}, {"$inc": {"version": 1}}, upsert=True)
+
+
+class CacheInvalidationBus:
+    def __init__(self, db, cache, poll_interval=POLL_INTERVAL, max_age=MAX_AGE):
+        self.db = db
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self.max_age = max_age
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure as e:
+                # Standalone servers have no change streams
+                logging.info("Change streams unavailable (%s), polling cache versions", e.code)
+                await self._poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error("Cache invalidation stream failed, retrying: %s", e)
+                # Anything may have changed while the stream was down
+                self.cache.invalidate_all()
+                await asyncio.sleep(1)
+
+    async def _watch(self):
+        names = list(self.cache.versions)
+        pipeline = [{"$match": {"ns.coll": {"$in": names + [CACHE_VERSIONS_COLLECTION]}}}]
+        async with self.db.watch(pipeline) as stream:
+            async for change in stream:
+                coll = change["ns"]["coll"]
+                if coll == CACHE_VERSIONS_COLLECTION:
+                    self.cache.invalidate(change["documentKey"]["_id"])
+                else:
+                    self.cache.invalidate(coll)
+
+    async def _poll(self):
+        seen = None
+        refreshed = time.monotonic()
+        while True:
+            try:
+                versions = {doc["_id"]: doc["version"] async for doc in self.db[CACHE_VERSIONS_COLLECTION].find({})}
+                if seen is None or time.monotonic() - refreshed >= self.max_age:
+                    self.cache.invalidate_all()
+                    refreshed = time.monotonic()
+                else:
+                    for name, version in versions.items():
+                        if seen.get(name) != version:
+                            self.cache.invalidate(name)
+                seen = versions
+            except Exception as e:
+                logging.error("Error polling cache versions: %s", e)
+            await asyncio.sleep(self.poll_interval)
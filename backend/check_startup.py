@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Fail when building the API takes longer than the startup budget.
+
+Runs ``import server; server.create_app()`` in a fresh interpreter under
+``python -X importtime`` and prints the slowest imports. Exits non-zero
+when the total exceeds STARTUP_BUDGET_MS (default 800), so CI catches a
+heavy import sneaking onto the startup path.
+
+    python check_startup.py
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+
+ROOT_DIR = Path(__file__).parent
+BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', '800'))
+
+PROBE = """
+import time
+started = time.perf_counter()
+import server
+server.create_app()
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def measure_startup():
+    """Milliseconds to build the app in a fresh interpreter, and the slowest top-level imports."""
+    env = dict(os.environ)
+    # create_app() never connects, so any URL will do
+    env.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    env.setdefault('DB_NAME', 'startup_check')
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"building the app failed:\n{result.stderr}")
+
+    # "import time: self [us] | cumulative | imported package"
+    top_level = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            top_level.append((int(cumulative) / 1000, name.strip()))
+
+    elapsed_ms = float(result.stdout.strip().splitlines()[-1])
+    return elapsed_ms, sorted(top_level, reverse=True)[:10]
+
+
+def main():
+    try:
+        elapsed_ms, slowest = measure_startup()
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
+
+    print(f"Startup: {elapsed_ms:.0f} ms (budget {BUDGET_MS:.0f} ms)")
+    print("Slowest top-level imports:")
+    for ms, name in slowest:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    if elapsed_ms > BUDGET_MS:
+        print("❌ Startup budget exceeded")
+        sys.exit(1)
+    print("✅ Within startup budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Precompressed JSON responses for cached catalog snapshots.
+
+The body for a snapshot is rendered and compressed once, when the snapshot
+changes, and every request afterwards just picks the variant its
+``Accept-Encoding`` allows. Brotli is used when the optional ``brotli``
+package is installed; gzip is always available.
+"""
+
+import gzip
+import json
+
+from fastapi.encoders import jsonable_encoder
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+
+MIN_SIZE = 1024
+
+# Preferred first when the client accepts several
+ENCODINGS = ("br", "gzip")
+
+
+def render_json(content):
+    # Same rendering as FastAPI's JSONResponse
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def compress_variants(body, min_size=MIN_SIZE):
+    variants = {"identity": body}
+    if len(body) >= min_size:
+        # Maximum compression is affordable because it runs once per snapshot
+        variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            variants["br"] = brotli.compress(body, quality=11)
+    return variants
+
+
+def accepted_encodings(accept_encoding):
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedCache:
+    def __init__(self, min_size=MIN_SIZE):
+        self.min_size = min_size
+        self._entries = {}
+
+    def response(self, name, source, render, accept_encoding):
+        """Serve ``render(source)`` compressed, rebuilding only when ``source`` is a new snapshot."""
+        entry = self._entries.get(name)
+        if entry is None or entry[0] is not source:
+            entry = (source, compress_variants(render_json(render(source)), self.min_size))
+            self._entries[name] = entry
+        variants = entry[1]
+
+        accepted = accepted_encodings(accept_encoding or "")
+        headers = {"Vary": "Accept-Encoding"}
+        for encoding in ENCODINGS:
+            if encoding in variants and (encoding in accepted or "*" in accepted):
+                headers["Content-Encoding"] = encoding
+                return Response(variants[encoding], media_type="application/json", headers=headers)
+        return Response(variants["identity"], media_type="application/json", headers=headers)
+
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves responses under ``exclude_prefixes`` alone.
+
+    File downloads are mostly compressed formats already, and gzipping them
+    on the fly would cost CPU on every request and drop their Content-Length.
+    """
+
+    def __init__(self, app, exclude_prefixes=(), **options):
+        super().__init__(app, **options)
+        self.exclude_prefixes = tuple(exclude_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude_prefixes):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -0,0 +1,72 @@
+"""Promo codes evaluated against the cached coupon index.
+
+Coupon definitions live in ``coupons`` and are cached per worker like the
+catalog, so checking a code at checkout costs a dict lookup. Limited-use
+coupons are redeemed against a separate ``coupon_usage`` counter with a
+conditional ``$inc`` upsert: once ``used`` reaches ``maxUses`` the filter
+stops matching and the upsert collides on ``_id``, so concurrent checkouts
+cannot oversell. Keeping the counters out of ``coupons`` means redemptions
+do not invalidate every worker's cached coupons.
+"""
+
+from datetime import timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from pricing import CURRENCIES, currency_code
+
+
+COUPONS_COLLECTION = "coupons"
+COUPON_USAGE_COLLECTION = "coupon_usage"
+COUPON_CODE_PATTERN = "^[A-Za-z0-9_-]{3,32}$"
+
+
+def normalize_coupon_code(code):
+    return code.strip().upper()
+
+
+def naive_utc(value):
+    """``value`` as the naive UTC datetime ``evaluate_coupon`` compares with ``utcnow()``."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def evaluate_coupon(coupon, plan, now):
+    """Return ``(discount, error)`` for applying ``coupon`` to ``plan`` as priced for this order."""
+    if coupon is None:
+        return 0, "Invalid coupon code"
+    if coupon.get("startsAt") and now < coupon["startsAt"]:
+        return 0, "Coupon is not active yet"
+    if coupon.get("endsAt") and now >= coupon["endsAt"]:
+        return 0, "Coupon has expired"
+    if coupon.get("planIds") and plan["id"] not in coupon["planIds"]:
+        return 0, "Coupon does not apply to this plan"
+
+    code = currency_code(plan["currency"])
+    if coupon["type"] == "percent":
+        discount = plan["price"] * coupon["value"] / 100
+    elif coupon.get("currency") == code:
+        discount = coupon["value"]
+    else:
+        return 0, "Coupon is not valid in this currency"
+    decimals = CURRENCIES.get(code, {}).get("decimals", 2)
+    return round(min(discount, plan["price"]), decimals), None
+
+
+async def redeem_coupon(usage, coupon):
+    """Take one use of a limited coupon; False when it is used up."""
+    if coupon["maxUses"] < 1:
+        return False
+    try:
+        await usage.update_one(
+            {"_id": coupon["code"], "used": {"$lt": coupon["maxUses"]}}, {"$inc": {"used": 1}}, upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+async def release_coupon(usage, coupon):
+    """Give back a use taken by ``redeem_coupon`` for an order that was never created."""
+    await usage.update_one({"_id": coupon["code"], "used": {"$gt": 0}}, {"$inc": {"used": -1}})
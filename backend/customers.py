@@ -0,0 +1,132 @@
+"""Per-customer order history.
+
+Customers reach their history through a magic link carrying a signed,
+expiring token for their email address; links are issued by an admin
+endpoint and sent out of band, and the feature is disabled unless
+MAGIC_LINK_SECRET is set. Lifetime totals come from one summary document
+per customer, updated with ``$inc``/``$push`` whenever an order is
+confirmed, so showing them never aggregates over ``orders``. The summary
+lists the orders it counts, so recording an order twice changes nothing.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+from migrations import upgrade_order
+from pricing import currency_code
+
+
+SUMMARY_COLLECTION = "customer_summaries"
+TOKEN_PURPOSE = "customer-orders"
+
+# What a customer gets to see of each order
+ORDER_HISTORY_PROJECTION = {
+    "_id": 0,
+    "schemaVersion": 1,
+    "orderId": 1,
+    "planId": 1,
+    "planName": 1,
+    "amount": 1,
+    "currency": 1,
+    "listPrice": 1,
+    "discount": 1,
+    "couponCode": 1,
+    "paymentStatus": 1,
+    "downloadLinks": 1,
+    "downloadCount": 1,
+    "maxDownloads": 1,
+    "expiresAt": 1,
+    "createdAt": 1
+}
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+def magic_links_enabled():
+    return bool(os.environ.get('MAGIC_LINK_SECRET'))
+
+
+def _secret():
+    secret = os.environ.get('MAGIC_LINK_SECRET')
+    if not secret:
+        raise RuntimeError("MAGIC_LINK_SECRET is not set")
+    return secret
+
+
+def issue_customer_token(email):
+    import jwt
+
+    now = datetime.utcnow()
+    lifetime = timedelta(days=int(os.environ.get('MAGIC_LINK_TTL_DAYS', '30')))
+    claims = {"sub": normalize_email(email), "purpose": TOKEN_PURPOSE, "iat": now, "exp": now + lifetime}
+    return jwt.encode(claims, _secret(), algorithm="HS256")
+
+
+def verify_customer_token(token, email):
+    """True when ``token`` is a valid, unexpired magic-link token for ``email``."""
+    import jwt
+
+    try:
+        claims = jwt.decode(token, _secret(), algorithms=["HS256"])
+    except jwt.PyJWTError:
+        return False
+    return claims.get("purpose") == TOKEN_PURPOSE and claims.get("sub") == normalize_email(email)
+
+
+def customer_orders_url(email):
+    return f"/api/customers/{normalize_email(email)}/orders?token={issue_customer_token(email)}"
+
+
+async def record_confirmed_order(summaries, order):
+    """Fold a confirmed order into its customer's summary document, once."""
+    now = datetime.utcnow()
+    query = {"_id": normalize_email(order["customerEmail"]), "orderIds": {"$ne": order["orderId"]}}
+    update = {
+        "$inc": {
+            "confirmedOrders": 1,
+            f"lifetimeSpend.{currency_code(order['currency'])}": order["amount"]
+        },
+        "$push": {"downloadExpiries": order["expiresAt"]},
+        "$addToSet": {"orderIds": order["orderId"]},
+        "$max": {"lastOrderAt": order["createdAt"]},
+        "$set": {"updatedAt": now},
+        "$setOnInsert": {"createdAt": now}
+    }
+    try:
+        await summaries.update_one(query, update, upsert=True)
+    except DuplicateKeyError:
+        # The summary exists: either it already counts this order, or another
+        # order of the same customer created it first
+        await summaries.update_one(query, update)
+
+
+async def get_customer_history(orders, summaries, email, page, limit):
+    email = normalize_email(email)
+    cursor = (
+        orders.find({"customerEmail": email, "isActive": True}, ORDER_HISTORY_PROJECTION)
+        .sort("createdAt", -1)
+        .skip((page - 1) * limit)
+        .limit(limit + 1)
+    )
+    history = [upgrade_order(order) for order in await cursor.to_list(length=limit + 1)]
+
+    summary = await summaries.find_one({"_id": email}) or {}
+    now = datetime.utcnow()
+    totals = {
+        "confirmedOrders": summary.get("confirmedOrders", 0),
+        "lifetimeSpend": summary.get("lifetimeSpend", {}),
+        "activeDownloads": sum(1 for expires_at in summary.get("downloadExpiries", []) if expires_at > now),
+        "lastOrderAt": summary.get("lastOrderAt")
+    }
+    return {
+        "email": email,
+        "summary": totals,
+        "orders": history[:limit],
+        "page": page,
+        "limit": limit,
+        "hasMore": len(history) > limit
+    }
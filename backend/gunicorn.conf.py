@@ -0,0 +1,17 @@
+# Multi-worker serving: gunicorn -c gunicorn.conf.py server:app
+#
+# Each worker is a single-threaded event loop, so one worker per core is
+# enough to use the whole machine. Workers keep their own catalog cache;
+# cache.CacheInvalidationBus keeps those copies coherent.
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master so workers fork with it already loaded
+preload_app = True
+
+graceful_timeout = 30
+keepalive = 5
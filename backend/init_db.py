@@ -4,22 +4,23 @@ import asyncio
 import sys
 import os
 from pathlib import Path
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 from datetime import datetime
 from dotenv import load_dotenv
 
+from analytics import STATS_COLLECTION
+from audit import AUDIT_COLLECTION, AUDIT_COLLECTION_SIZE
+from coupons import COUPONS_COLLECTION
+from cache import bump_cache_version
+from storage import create_client
+
 # Add backend directory to path
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
 
 # Sample plans data
 PLANS_DATA = [
     {
+        "slug": "basic",
         "name": "Basic Plan",
         "price": 2.0,
         "currency": "$",
@@ -41,11 +42,10 @@ PLANS_DATA = [
         "isPopular": False,
         "isBestValue": False,
         "downloadFiles": ["/files/basic-grammar-book.pdf"],
-        "isActive": True,
-        "createdAt": datetime.utcnow(),
-        "updatedAt": datetime.utcnow()
+        "isActive": True
     },
     {
+        "slug": "expert",
         "name": "Expert Plan",
         "price": 5.0,
         "currency": "$",
@@ -70,11 +70,10 @@ PLANS_DATA = [
         "isPopular": True,
         "isBestValue": False,
         "downloadFiles": ["/files/expert-english-book.pdf", "/files/audio-pronunciation-guide.zip"],
-        "isActive": True,
-        "createdAt": datetime.utcnow(),
-        "updatedAt": datetime.utcnow()
+        "isActive": True
     },
     {
+        "slug": "legend",
         "name": "Legend Plan",
         "price": 15.0,
         "currency": "$",
@@ -111,90 +110,178 @@ PLANS_DATA = [
             "/files/native-speaking-techniques.pdf",
             "/files/bonus-materials.zip"
         ],
-        "isActive": True,
-        "createdAt": datetime.utcnow(),
-        "updatedAt": datetime.utcnow()
+        "isActive": True
     }
 ]
 
 # Sample testimonials data
 TESTIMONIALS_DATA = [
     {
+        "seedKey": "priya-sharma-basic",
         "name": "Priya Sharma",
         "location": "Mumbai, India",
         "rating": 5,
         "text": "The Basic Plan taught me grammar in a way that immediately improved my speaking. Now I can form sentences correctly and speak with more confidence!",
         "planName": "Basic Plan",
         "isApproved": True,
-        "isActive": True,
-        "createdAt": datetime.utcnow()
+        "isActive": True
     },
     {
+        "seedKey": "rajesh-kumar-expert",
         "name": "Rajesh Kumar",
         "location": "Delhi, India",
         "rating": 5,
         "text": "Expert Plan completely transformed my confidence in English speaking. The practical examples and conversation techniques are amazing!",
         "planName": "Expert Plan",
         "isApproved": True,
-        "isActive": True,
-        "createdAt": datetime.utcnow()
+        "isActive": True
     },
     {
+        "seedKey": "anita-patel-legend",
         "name": "Anita Patel",
         "location": "Bangalore, India", 
         "rating": 5,
         "text": "Legend Plan helped me speak English properly like a native speaker. Now people think English is my first language! Incredible value.",
         "planName": "Legend Plan",
         "isApproved": True,
-        "isActive": True,
-        "createdAt": datetime.utcnow()
+        "isActive": True
     },
     {
+        "seedKey": "mohammed-hassan-expert",
         "name": "Mohammed Hassan",
         "location": "Dubai, UAE",
         "rating": 5,
         "text": "The confidence-building techniques in Expert Plan helped me overcome my fear of speaking English in meetings. Highly recommended!",
         "planName": "Expert Plan",
         "isApproved": True,
-        "isActive": True,
-        "createdAt": datetime.utcnow()
+        "isActive": True
     },
     {
+        "seedKey": "sarah-johnson-legend",
         "name": "Sarah Johnson",
         "location": "London, UK",
         "rating": 5,
         "text": "Legend Plan is the complete solution for speaking English expertly. The native-level techniques and pronunciation training are exceptional!",
         "planName": "Legend Plan",
         "isApproved": True,
-        "isActive": True,
-        "createdAt": datetime.utcnow()
+        "isActive": True
     }
 ]
 
+async def seed_collection(collection, seed_docs, key_fields):
+    """Upsert seed documents by a stable key and return a diff of what changed.
+
+    Documents keep their _id, so references such as an order's planId stay
+    valid, and unchanged documents are not written at all.
+    """
+    existing = {}
+    async for doc in collection.find({}):
+        # Documents without the key, such as submitted testimonials, were never seeded
+        if all(field in doc for field in key_fields):
+            existing[tuple(doc[field] for field in key_fields)] = doc
+
+    now = datetime.utcnow()
+    operations = []
+    diff = {"added": [], "updated": [], "unchanged": []}
+    for seed_doc in seed_docs:
+        key = tuple(seed_doc[field] for field in key_fields)
+        label = " / ".join(str(part) for part in key)
+        current = existing.pop(key, None)
+        if current is None:
+            operations.append(UpdateOne(
+                {field: seed_doc[field] for field in key_fields},
+                {"$set": {**seed_doc, "updatedAt": now}, "$setOnInsert": {"createdAt": now}},
+                upsert=True
+            ))
+            diff["added"].append(label)
+            continue
+
+        changed = {field: value for field, value in seed_doc.items() if field not in current or current[field] != value}
+        if changed:
+            operations.append(UpdateOne({"_id": current["_id"]}, {"$set": {**changed, "updatedAt": now}}))
+            diff["updated"].append(f"{label} ({', '.join(sorted(changed))})")
+        else:
+            diff["unchanged"].append(label)
+
+    # Documents that are no longer seeded are left alone: orders may reference them
+    diff["untouched"] = [" / ".join(str(part) for part in key) for key in existing]
+
+    if operations:
+        await collection.bulk_write(operations, ordered=False)
+    return diff
+
+
+def print_diff(name, diff):
+    print(f"✅ {name}: {len(diff['added'])} added, {len(diff['updated'])} updated, {len(diff['unchanged'])} unchanged")
+    for label in diff["added"]:
+        print(f"   + {label}")
+    for label in diff["updated"]:
+        print(f"   ~ {label}")
+    for label in diff["untouched"]:
+        print(f"   ? {label} (not in seed data, left as is)")
+
+
+async def seed_database(db):
+    """Bring ``db`` in line with the seed data and return the plan and testimonial diffs."""
+    # Older seeds had no slug; adopt those plans by name instead of duplicating them
+    for plan in PLANS_DATA:
+        await db.plans.update_one(
+            {"name": plan["name"], "slug": {"$exists": False}}, {"$set": {"slug": plan["slug"]}}
+        )
+
+    # Likewise for testimonials seeded before they had a seedKey, matched on
+    # their full text: anyone can submit a testimonial under the same name
+    for testimonial in TESTIMONIALS_DATA:
+        await db.testimonials.update_one(
+            {
+                "name": testimonial["name"],
+                "planName": testimonial["planName"],
+                "text": testimonial["text"],
+                "seedKey": {"$exists": False}
+            },
+            {"$set": {"seedKey": testimonial["seedKey"]}}
+        )
+
+    plans_diff = await seed_collection(db.plans, PLANS_DATA, ["slug"])
+    testimonials_diff = await seed_collection(db.testimonials, TESTIMONIALS_DATA, ["seedKey"])
+
+    # Only make API workers drop their cached catalog when something changed
+    if plans_diff["added"] or plans_diff["updated"]:
+        await bump_cache_version(db, "plans")
+    if testimonials_diff["added"] or testimonials_diff["updated"]:
+        await bump_cache_version(db, "testimonials")
+
+    # Create indexes for better performance; background builds don't
+    # block reads and writes on a live database
+    await db.plans.create_index("slug", unique=True, sparse=True, background=True)
+    await db.plans.create_index("name", background=True)
+    await db.plans.create_index("isActive", background=True)
+    await db.orders.create_index("orderId", unique=True, background=True)
+    await db.orders.create_index("customerEmail", background=True)
+    # Customer order history: equality on email, newest first
+    await db.orders.create_index([("customerEmail", 1), ("createdAt", -1)], background=True)
+    await db.testimonials.create_index("isApproved", background=True)
+    await db.testimonials.create_index("seedKey", unique=True, sparse=True, background=True)
+    await db[COUPONS_COLLECTION].create_index("code", unique=True, background=True)
+    # Sales stats are read by day range
+    await db[STATS_COLLECTION].create_index("day", background=True)
+
+    # Download audit trail: capped collection queried per order
+    if AUDIT_COLLECTION not in await db.list_collection_names():
+        await db.create_collection(AUDIT_COLLECTION, capped=True, size=AUDIT_COLLECTION_SIZE)
+    await db[AUDIT_COLLECTION].create_index([("orderId", 1), ("timestamp", -1)], background=True)
+    return plans_diff, testimonials_diff
+
+
 async def init_database():
-    """Initialize the database with sample data."""
+    """Bring the database in line with the seed data; safe to run on every deploy."""
+    load_dotenv(ROOT_DIR / '.env')
+    client = create_client(os.environ['MONGO_URL'])
     try:
         print("🔄 Initializing database...")
-        
-        # Clear existing data
-        await db.plans.delete_many({})
-        await db.testimonials.delete_many({})
-        print("✅ Cleared existing data")
-        
-        # Insert plans
-        result = await db.plans.insert_many(PLANS_DATA)
-        print(f"✅ Inserted {len(result.inserted_ids)} plans")
-        
-        # Insert testimonials
-        result = await db.testimonials.insert_many(TESTIMONIALS_DATA)
-        print(f"✅ Inserted {len(result.inserted_ids)} testimonials")
-        
-        # Create indexes for better performance
-        await db.plans.create_index("name")
-        await db.plans.create_index("isActive")
-        await db.orders.create_index("orderId", unique=True)
-        await db.orders.create_index("customerEmail")
-        await db.testimonials.create_index("isApproved")
+        plans_diff, testimonials_diff = await seed_database(client[os.environ['DB_NAME']])
+        print_diff("Plans", plans_diff)
+        print_diff("Testimonials", testimonials_diff)
         print("✅ Created database indexes")
         
         print("🎉 Database initialization completed successfully!")
@@ -0,0 +1,180 @@
+"""Structured logging that never blocks the event loop.
+
+Records are put on a bounded in-memory queue by a ``QueueHandler`` and
+written out as one JSON object per line by a ``QueueListener`` thread.
+Before a record is queued it is tagged with the current request ID and
+passed through a per-message rate limit: the key is the unformatted
+template (``"Error fetching order %s: %s"``), so an outage that fails every
+request produces a handful of lines per minute, each reporting how many
+identical messages were suppressed since the last one.
+"""
+
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+
+request_id = ContextVar("request_id", default=None)
+
+REQUEST_ID_HEADER = b"x-request-id"
+# Client-supplied IDs are echoed into logs and headers, so keep them tame
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Let at most ``burst`` records per message template through every ``interval`` seconds."""
+
+    def __init__(self, burst=20, interval=60.0, max_keys=10000):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_keys = max_keys
+        # (logger, level, template) -> [window start, records seen, records suppressed]
+        self._windows = {}
+
+    def filter(self, record):
+        now = time.monotonic()
+        key = (record.name, record.levelno, str(record.msg))
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            if window is None and len(self._windows) >= self.max_keys:
+                self._windows = {k: w for k, w in self._windows.items() if now - w[0] < self.interval}
+            suppressed = window[2] if window is not None else 0
+            window = self._windows[key] = [now, 0, 0]
+            if suppressed:
+                record.suppressed = suppressed
+        window[1] += 1
+        if window[1] > self.burst:
+            window[2] += 1
+            return False
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["requestId"] = record.request_id
+        if getattr(record, "suppressed", None):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        if getattr(record, "request_id", None):
+            line += f" [request {record.request_id}]"
+        if getattr(record, "suppressed", None):
+            line += f" ({record.suppressed} similar messages suppressed)"
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Merge the arguments now, but keep the traceback apart from the message
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level="INFO", fmt="json", burst=20, interval=60.0, max_queued=10000):
+    """Route the root and uvicorn loggers through a queue; returns the started listener."""
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    log_queue = queue.Queue(maxsize=max_queued)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(RateLimitFilter(burst, interval))
+    # Access log lines share one template, so they are not rate limited
+    access_handler = DroppingQueueHandler(log_queue)
+    access_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    for name in ("uvicorn", "uvicorn.error"):
+        logger = logging.getLogger(name)
+        if logger.handlers:
+            logger.handlers = [handler]
+    access_logger = logging.getLogger("uvicorn.access")
+    if access_logger.handlers:
+        access_logger.handlers = [access_handler]
+
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    return listener
+
+
+class RequestIdMiddleware:
+    """Give every request an ID, taken from X-Request-ID or generated, and echo it back."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        current = None
+        for key, value in scope["headers"]:
+            if key == REQUEST_ID_HEADER:
+                value = value.decode("latin-1")
+                if REQUEST_ID_RE.match(value):
+                    current = value
+                break
+        current = current or uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (REQUEST_ID_HEADER, current.encode("latin-1"))]
+            await send(message)
+
+        token = request_id.set(current)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
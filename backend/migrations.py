@@ -0,0 +1,194 @@
+"""Schema-versioned order documents.
+
+Every order carries a ``schemaVersion``. Changing the shape of an order
+means registering an upgrade from the previous version here and bumping
+ORDER_SCHEMA_VERSION: handlers pass each order they read through
+``upgrade_order``, so old documents look current without rewriting the
+collection. Writes a handler makes anyway carry the upgraded fields along,
+and the optional ``OrderMigrator`` rewrites the rest a small batch at a
+time, walking ``orders`` in ``_id`` order.
+
+Upgrades may add or rewrite top-level fields but never remove them, so a
+worker still running the previous release can read upgraded documents.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from resilience import DatabaseUnavailable
+
+
+ORDER_SCHEMA_VERSION = 2
+MIGRATIONS_COLLECTION = "migrations"
+
+# version -> upgrade from that version to the next, applied to a copy in place
+ORDER_UPGRADES = {}
+
+
+def order_upgrade(from_version):
+    def register(upgrade):
+        ORDER_UPGRADES[from_version] = upgrade
+        return upgrade
+    return register
+
+
+@order_upgrade(0)
+def _plan_id_as_string(order):
+    # Orders written to the original contract referenced the plan by ObjectId;
+    # the API has always looked plans up, and counted sales, by the string
+    if isinstance(order.get("planId"), ObjectId):
+        order["planId"] = str(order["planId"])
+
+
+@order_upgrade(1)
+def _coupon_pricing(order):
+    # Orders from before coupons were charged the list price
+    if "amount" in order:
+        order.setdefault("listPrice", order["amount"])
+        order.setdefault("discount", 0)
+        order.setdefault("couponCode", None)
+
+
+def upgrade_order(order):
+    """``order`` in the current schema; the document itself when it already is."""
+    version = order.get("schemaVersion", 0)
+    if version >= ORDER_SCHEMA_VERSION:
+        return order
+    order = dict(order)
+    while version < ORDER_SCHEMA_VERSION:
+        ORDER_UPGRADES[version](order)
+        version += 1
+    order["schemaVersion"] = version
+    return order
+
+
+def upgraded_fields(original, upgraded):
+    """The ``$set`` that stores ``upgraded`` over ``original``; empty when nothing changed."""
+    if upgraded is original:
+        return {}
+    return {
+        key: value for key, value in upgraded.items()
+        if key not in original or type(original[key]) is not type(value) or original[key] != value
+    }
+
+
+def outdated_query():
+    # $not also matches orders that have no schemaVersion at all
+    return {"schemaVersion": {"$not": {"$gte": ORDER_SCHEMA_VERSION}}}
+
+
+class OrderMigrator:
+    """Rewrites orders still in an old schema, one throttled batch at a time.
+
+    Only the worker holding the lease in ``migrations`` migrates; the last
+    ``_id`` done is kept in the same document, so a restart, or another
+    worker taking over, continues where it stopped instead of rescanning.
+    Each order is updated only if its ``schemaVersion`` is still the one
+    that was read, so it never overwrites an upgrade a handler wrote first.
+    """
+
+    def __init__(self, collection, progress, batch_size=100, interval=1.0, lease=30.0):
+        self.collection = collection
+        self.progress = progress
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._task = None
+        self._breaker = None
+        self._closing = False
+
+    async def _claim(self):
+        """The progress document if this worker holds (or just took) the lease, else None."""
+        now = datetime.utcnow()
+        try:
+            await self.progress.update_one(
+                {"_id": "orders", "$or": [{"owner": self.owner}, {"leaseUntil": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "leaseUntil": now + timedelta(seconds=self.lease)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Another worker holds the lease
+            return None
+        return await self.progress.find_one({"_id": "orders"})
+
+    async def migrate_batch(self, after_id):
+        """Upgrade the next outdated orders after ``after_id``; returns (last _id, count), (None, 0) at the end."""
+        query = outdated_query()
+        if after_id is not None:
+            query["_id"] = {"$gt": after_id}
+        cursor = self.collection.find(query).sort("_id", 1).limit(self.batch_size)
+        docs = await cursor.to_list(length=self.batch_size)
+        if not docs:
+            return None, 0
+        operations = [
+            UpdateOne(
+                {"_id": doc["_id"], "schemaVersion": doc.get("schemaVersion")},
+                {"$set": upgraded_fields(doc, upgrade_order(doc))}
+            )
+            for doc in docs
+        ]
+        await self.collection.bulk_write(operations, ordered=False)
+        return docs[-1]["_id"], len(docs)
+
+    async def step(self):
+        """Migrate one batch if this worker holds the lease; True once every order is current."""
+        progress = await self._breaker.call(self._claim, 10.0)
+        if progress is None:
+            return False
+        if progress.get("completedVersion") == ORDER_SCHEMA_VERSION:
+            return True
+
+        # A new schema version starts over from the first order
+        after_id = progress.get("lastId") if progress.get("schemaVersion") == ORDER_SCHEMA_VERSION else None
+        last_id, count = await self._breaker.call(lambda: self.migrate_batch(after_id), 30.0)
+        if last_id is None:
+            # Hands the lease back, so the next schema version can start at once
+            now = datetime.utcnow()
+            await self._breaker.call(lambda: self.progress.update_one(
+                {"_id": "orders"},
+                {"$set": {"completedVersion": ORDER_SCHEMA_VERSION, "completedAt": now, "leaseUntil": now}}
+            ), 10.0)
+            logging.info("Order migration to schema version %s complete", ORDER_SCHEMA_VERSION)
+            return True
+
+        if after_id is None:
+            update = {"$set": {"lastId": last_id, "schemaVersion": ORDER_SCHEMA_VERSION, "migrated": count}}
+        else:
+            update = {"$set": {"lastId": last_id}, "$inc": {"migrated": count}}
+        await self._breaker.call(lambda: self.progress.update_one({"_id": "orders"}, update), 10.0)
+        return False
+
+    def start(self, breaker):
+        self._breaker = breaker
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            # The flag stops the loop even if wait_for swallows the cancellation
+            self._closing = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                if await self.step():
+                    return
+            except DatabaseUnavailable:
+                pass
+            except Exception as e:
+                logging.error("Error migrating orders: %s", e)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,128 @@
+"""Localized plan prices.
+
+Plans are priced in their own currency. For every other supported currency
+the catalog is converted once per snapshot and exchange-rate table, from a
+local JSON file that ``refresh_exchange_rates.py`` keeps current, and kept
+with an id -> plan index. Serving a price list or pricing an order is then
+a dict lookup, and the amount an order is created with never changes.
+"""
+
+import asyncio
+import json
+import logging
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+
+
+# Currencies we sell in, with how their prices are displayed and rounded
+CURRENCIES = {
+    "USD": {"symbol": "$", "decimals": 2},
+    # UPI buyers see whole rupees
+    "INR": {"symbol": "₹", "decimals": 0},
+}
+# Orders and plans store the symbol; Mongo field names cannot start with "$",
+# so totals are keyed by code
+CURRENCY_CODES = {spec["symbol"]: code for code, spec in CURRENCIES.items()}
+# Countries (ISO 3166 alpha-2) that pay in something other than their plan's currency
+REGION_CURRENCIES = {"IN": "INR"}
+
+RATES_FILE = Path(__file__).parent / "exchange_rates.json"
+RATES_POLL_INTERVAL = 30.0
+
+
+def currency_code(currency):
+    return CURRENCY_CODES.get(currency, currency)
+
+
+def resolve_currency(currency=None, region=None):
+    """The currency code asked for, by code, symbol or region; None means the plans' own prices."""
+    if currency:
+        return currency_code(currency).upper()
+    if region:
+        return REGION_CURRENCIES.get(region.upper(), "USD")
+    return None
+
+
+def load_rates(path):
+    with open(path) as f:
+        table = json.load(f)
+    rates = {code: Decimal(str(rate)) for code, rate in table["rates"].items() if rate}
+    return {"base": table["base"], "updatedAt": table.get("updatedAt"), "rates": rates}
+
+
+class PriceTable:
+    def __init__(self, path=RATES_FILE, poll_interval=RATES_POLL_INTERVAL):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.rates = None
+        self._mtime = None
+        # currency code -> (source snapshot, localized plans, index by id)
+        self._entries = {}
+        self._task = None
+
+    def reload(self):
+        """Load the rate table if the file changed; True when new rates are in use."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+            if mtime == self._mtime:
+                return False
+            rates = load_rates(self.path)
+        except (OSError, ValueError, KeyError) as e:
+            logging.error("Error loading exchange rates from %s: %s", self.path, e)
+            return False
+        self.rates, self._mtime = rates, mtime
+        self._entries = {}
+        logging.info("Loaded exchange rates from %s (updated %s)", self.path, rates["updatedAt"])
+        return True
+
+    def convert(self, amount, from_code, to_code):
+        if amount is None:
+            return None
+        if from_code == to_code:
+            return amount
+        rates = self.rates["rates"]
+        converted = Decimal(str(amount)) * rates[to_code] / rates[from_code]
+        step = Decimal(1).scaleb(-CURRENCIES[to_code]["decimals"])
+        return float(converted.quantize(step, rounding=ROUND_HALF_UP))
+
+    def _localize(self, plan, code):
+        from_code = currency_code(plan["currency"])
+        return {
+            **plan,
+            "price": self.convert(plan["price"], from_code, code),
+            "originalPrice": self.convert(plan.get("originalPrice"), from_code, code),
+            "currency": CURRENCIES[code]["symbol"],
+            "currencyCode": code
+        }
+
+    def supports(self, code):
+        if code not in CURRENCIES or self.rates is None:
+            return False
+        return code in self.rates["rates"]
+
+    def localized(self, plans, code):
+        """``plans`` priced in ``code`` and indexed by id, built once per snapshot."""
+        entry = self._entries.get(code)
+        if entry is None or entry[0] is not plans:
+            localized = [self._localize(plan, code) for plan in plans]
+            entry = (plans, localized, {plan["id"]: plan for plan in localized})
+            self._entries[code] = entry
+        return entry[1], entry[2]
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            self.reload()
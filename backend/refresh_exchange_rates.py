@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Refresh the local exchange-rate table the API prices plans from.
+
+Fetches current rates for the currencies we sell in and atomically
+replaces ``exchange_rates.json`` (or EXCHANGE_RATES_FILE); running API
+workers pick the new file up within a minute. A rate that moved by more
+than --max-change is treated as a bad feed and nothing is written.
+Meant to run from cron, e.g. daily.
+
+    python refresh_exchange_rates.py [--max-change 0.2]
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+from pricing import CURRENCIES, RATES_FILE
+
+
+RATES_URL = "https://open.er-api.com/v6/latest/USD"
+
+
+def fetch_rates(url):
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    payload = response.json()
+    missing = [code for code in CURRENCIES if code not in payload["rates"]]
+    if missing:
+        raise ValueError(f"feed has no rate for {', '.join(missing)}")
+    return {
+        "base": payload["base_code"],
+        "updatedAt": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "source": url,
+        "rates": {code: payload["rates"][code] for code in CURRENCIES}
+    }
+
+
+def check_change(current, table, max_change):
+    if current is None or current.get("base") != table["base"]:
+        return
+    for code, rate in table["rates"].items():
+        previous = current["rates"].get(code)
+        if previous and abs(rate - previous) / previous > max_change:
+            raise ValueError(f"{code} moved from {previous} to {rate}; rerun with a larger --max-change if that is real")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the local exchange-rate table")
+    parser.add_argument("--max-change", type=float, default=0.2, help="largest accepted relative move per rate")
+    args = parser.parse_args()
+
+    path = Path(os.environ.get('EXCHANGE_RATES_FILE', RATES_FILE))
+    try:
+        current = json.loads(path.read_text()) if path.is_file() else None
+        table = fetch_rates(os.environ.get('EXCHANGE_RATES_URL', RATES_URL))
+        check_change(current, table, args.max_change)
+
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(table, indent=2, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+        print(f"✅ Exchange rates updated: {', '.join(f'{code} {rate}' for code, rate in table['rates'].items())}")
+    except Exception as e:
+        print(f"❌ Error refreshing exchange rates: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
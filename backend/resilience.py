@@ -0,0 +1,300 @@
+"""Keeping the storefront up through MongoDB outages.
+
+- ``CircuitBreaker`` puts a deadline on every Motor call and, after repeated
+  failures, fails fast instead of letting each request wait for the driver.
+- ``SnapshotStore`` keeps the last known good copy of read-mostly data on
+  local disk so catalog reads can be served while Mongo is down.
+- ``OrderSpool`` is an fsync'd append-only log that orders are written to
+  when Mongo cannot take them, or always in write-behind mode; it is
+  replayed into Mongo in the background.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+
+from bson import json_util
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout
+
+
+DUPLICATE_KEY = 11000
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    async def call(self, operation, timeout):
+        """Await ``operation()`` with a deadline, raising DatabaseUnavailable on outage."""
+        trial = False
+        if self.opened_at is not None:
+            if self._trial_in_flight or time.monotonic() - self.opened_at < self.reset_timeout:
+                raise DatabaseUnavailable("circuit open")
+            # Half-open: let a single request probe the database
+            self._trial_in_flight = trial = True
+
+        try:
+            result = await asyncio.wait_for(operation(), timeout=timeout)
+        except (asyncio.TimeoutError, ConnectionFailure, ExecutionTimeout) as e:
+            self._record_failure()
+            raise DatabaseUnavailable(str(e) or type(e).__name__) from e
+        finally:
+            if trial:
+                self._trial_in_flight = False
+
+        self.failures = 0
+        if self.opened_at is not None:
+            logging.info("MongoDB recovered, closing circuit")
+            self.opened_at = None
+        return result
+
+    def _record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logging.error("MongoDB failing (%s errors in a row), opening circuit", self.failures)
+            self.opened_at = time.monotonic()
+
+
+def _write_atomic(path, data):
+    # Per process: every worker saves the same snapshot after an invalidation
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SnapshotStore:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._memory = {}
+
+    async def save(self, name, value):
+        self._memory[name] = value
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(_write_atomic, self.directory / f"{name}.json", json_util.dumps(value))
+        except OSError as e:
+            logging.error("Error saving %s snapshot: %s", name, e)
+
+    def load(self, name):
+        if name not in self._memory:
+            path = self.directory / f"{name}.json"
+            if not path.is_file():
+                return None
+            self._memory[name] = json_util.loads(path.read_text())
+        return self._memory[name]
+
+
+def _append_lines(path, lines):
+    data = "".join(line + "\n" for line in lines).encode("utf-8")
+    with open(path, "ab+") as f:
+        # A failed earlier write can leave a partial line; end it, so it
+        # cannot run into the records written now
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                data = b"\n" + data
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_records(path):
+    """The records in a log segment, setting aside lines that do not parse."""
+    text = path.read_text(encoding="utf-8", errors="replace")
+    lines = text.split("\n")
+    # Without a newline the last record was cut short by a crash; it was
+    # never fsync'd, so its order was never acknowledged
+    torn = lines.pop()
+    if torn.strip():
+        logging.warning("Dropping a partial record at the end of %s", path.name)
+    docs, rejected = [], []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            docs.append(json_util.loads(line))
+        except (ValueError, TypeError, KeyError):
+            rejected.append(line)
+    if rejected:
+        # Kept for inspection instead of blocking the rest of the segment
+        logging.error("Setting aside %s unreadable records from %s", len(rejected), path.name)
+        _append_lines(path.with_suffix(".rejected"), rejected)
+    return docs
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class OrderSpool:
+    """Durable local log of orders that still have to reach MongoDB.
+
+    Appends are group-committed: orders arriving while a write is in flight
+    share the next write and fsync. The background replayer moves the active
+    file aside as a ``.flushing`` segment and inserts it in batches, so new
+    appends never wait on Mongo. Every worker process logs to its own file and
+    adopts the files of workers that died; orders carry their ``_id``, so a
+    replay after a crash is idempotent.
+    """
+
+    def __init__(self, directory, name="orders", replay_interval=5.0, batch_size=500):
+        self.directory = Path(directory)
+        self.name = name
+        self.replay_interval = replay_interval
+        self.batch_size = batch_size
+        # Orders appended by this process that are not in Mongo yet, by orderId
+        self.pending = {}
+        self._buffer = []
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._collection = None
+        self._breaker = None
+        self._closing = False
+
+    @property
+    def path(self):
+        # Resolved on use: gunicorn forks workers after the spool is created
+        return self.directory / f"{self.name}.{os.getpid()}.log"
+
+    def has_pending(self):
+        return self.path.is_file() and self.path.stat().st_size > 0
+
+    async def append(self, doc):
+        """Return once ``doc`` is fsync'd to the local log."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending[doc["orderId"]] = dict(doc)
+        self._buffer.append((json_util.dumps(doc), future))
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_buffered())
+        try:
+            await future
+        except BaseException:
+            self.pending.pop(doc["orderId"], None)
+            raise
+
+    async def _write_buffered(self):
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            while self._buffer:
+                batch, self._buffer = self._buffer, []
+                try:
+                    async with self._lock:
+                        await asyncio.to_thread(_append_lines, self.path, [line for line, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+        finally:
+            self._writer = None
+
+    def _segment_path(self):
+        return self.directory / f"{self.name}.{os.getpid()}.{time.time_ns()}.flushing"
+
+    def adopt_orphans(self):
+        """Take over the logs of worker processes that are no longer running."""
+        if not self.directory.is_dir():
+            return
+        for path in self.directory.glob(f"{self.name}.*"):
+            parts = path.name.split(".")
+            if len(parts) < 3 or not parts[1].isdigit() or path.suffix not in (".log", ".flushing"):
+                continue
+            pid = int(parts[1])
+            if pid == os.getpid() or _process_alive(pid):
+                continue
+            try:
+                os.replace(path, self._segment_path())
+            except FileNotFoundError:
+                # Another worker adopted it first
+                pass
+
+    async def replay(self, collection, breaker, timeout=30.0):
+        """Move logged orders into ``collection``; returns how many were replayed."""
+        segments = sorted(self.directory.glob(f"{self.name}.{os.getpid()}.*.flushing"))
+        if self.has_pending():
+            async with self._lock:
+                segment = self._segment_path()
+                os.replace(self.path, segment)
+            segments.append(segment)
+
+        replayed = 0
+        for segment in segments:
+            docs = _read_records(segment)
+            for start in range(0, len(docs), self.batch_size):
+                batch = docs[start:start + self.batch_size]
+                try:
+                    await breaker.call(lambda: collection.insert_many(batch, ordered=False), timeout)
+                except BulkWriteError as e:
+                    # Documents written before a crash or timeout are already there
+                    if any(err["code"] != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+                        raise
+            segment.unlink()
+            for doc in docs:
+                self.pending.pop(doc["orderId"], None)
+            replayed += len(docs)
+        return replayed
+
+    def start(self, collection, breaker):
+        self._collection = collection
+        self._breaker = breaker
+        self.adopt_orphans()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            # The flag stops the loop even if wait_for swallows the cancellation
+            self._closing = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            # Last attempt; whatever is left stays in the log for the next start
+            await self._replay_logged()
+
+    async def _replay_logged(self):
+        try:
+            replayed = await self.replay(self._collection, self._breaker)
+            if replayed:
+                logging.info("Replayed %s logged orders into MongoDB", replayed)
+        except DatabaseUnavailable:
+            pass
+        except Exception as e:
+            logging.error("Error replaying order spool: %s", e)
+
+    async def _run(self):
+        while not self._closing:
+            self.adopt_orphans()
+            await self._replay_logged()
+            await asyncio.sleep(self.replay_interval)
@@ -0,0 +1,125 @@
+"""In-process full-text search over the cached catalog.
+
+The inverted index is kept in step with the catalog cache: every time a new
+snapshot of plans or testimonials is handed to ``sync``, only documents
+whose indexed text changed are re-tokenized. Results are ranked with BM25.
+"""
+
+import math
+import re
+from collections import defaultdict
+
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "i", "in", "is",
+    "it", "my", "of", "on", "or", "the", "to", "with", "you", "your"
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def _stem(token):
+    # Just enough to match "interviews" with "interview"
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [_stem(token) for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def _field_values(doc, field):
+    value = doc.get(field)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [str(value)]
+
+
+class SearchIndex:
+    def __init__(self, fields):
+        # kind -> {field: weight}; heavier fields count their terms more often
+        self.fields = fields
+        self._sources = {}
+        self._docs = {}
+        self._postings = defaultdict(dict)
+        self._total_length = 0
+
+    def sync(self, kind, docs):
+        """Bring the index in line with ``docs``, the current snapshot of ``kind``."""
+        if self._sources.get(kind) is docs:
+            return
+        seen = set()
+        for doc in docs:
+            key = (kind, doc["id"])
+            seen.add(key)
+            text = [(value, weight) for field, weight in self.fields[kind].items()
+                    for value in _field_values(doc, field)]
+            indexed = self._docs.get(key)
+            if indexed is not None and indexed["text"] == text:
+                indexed["doc"] = doc
+                continue
+            if indexed is not None:
+                self._remove(key)
+            self._add(key, doc, text)
+
+        for key in [key for key in self._docs if key[0] == kind and key not in seen]:
+            self._remove(key)
+        self._sources[kind] = docs
+
+    def _add(self, key, doc, text):
+        term_counts = defaultdict(int)
+        for value, weight in text:
+            for token in tokenize(value):
+                term_counts[token] += weight
+        length = sum(term_counts.values())
+        for term, count in term_counts.items():
+            self._postings[term][key] = count
+        self._docs[key] = {"doc": doc, "text": text, "terms": list(term_counts), "length": length}
+        self._total_length += length
+
+    def _remove(self, key):
+        indexed = self._docs.pop(key)
+        for term in indexed["terms"]:
+            postings = self._postings[term]
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= indexed["length"]
+
+    def search(self, query, kinds=None, offset=0, limit=10):
+        """Return the total hit count and one page of ``(score, kind, doc, matches)``, best first.
+
+        ``matches`` lists the indexed values (e.g. plan features) that
+        contain a query term.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self._docs:
+            return 0, []
+
+        doc_count = len(self._docs)
+        average_length = self._total_length / doc_count or 1
+        scores = defaultdict(float)
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, tf in postings.items():
+                if kinds and key[0] not in kinds:
+                    continue
+                length = self._docs[key]["length"]
+                scores[key] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average_length))
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        page = []
+        for key, score in ranked[offset:offset + limit]:
+            indexed = self._docs[key]
+            matches = [value for value, _ in indexed["text"] if terms & set(tokenize(value))]
+            page.append((score, key[0], indexed["doc"], matches))
+        return len(ranked), page
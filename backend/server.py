@@ -1,31 +1,92 @@
-from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile
+from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Request, Query, Header, Depends
 from fastapi.responses import FileResponse
-from dotenv import load_dotenv
+from starlette.background import BackgroundTask
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from typing import List, Literal, Optional
 import uuid
-from datetime import datetime, timedelta
+import time
+import secrets
+from datetime import date, datetime, timedelta
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from analytics import STATS_COLLECTION, SalesCounters, get_sales_stats
+from audit import AUDIT_COLLECTION, get_download_events
+from cache import CacheInvalidationBus, CatalogCache, bump_cache_version
+from compression import PrecompressedCache, SelectiveGZipMiddleware
+from coupons import (
+    COUPON_CODE_PATTERN, COUPON_USAGE_COLLECTION, COUPONS_COLLECTION, evaluate_coupon, naive_utc,
+    normalize_coupon_code, redeem_coupon, release_coupon
+)
+from customers import (
+    SUMMARY_COLLECTION, customer_orders_url, get_customer_history, magic_links_enabled, normalize_email,
+    record_confirmed_order, verify_customer_token
+)
+from logs import RequestIdMiddleware, configure_logging
+from migrations import MIGRATIONS_COLLECTION, ORDER_SCHEMA_VERSION, OrderMigrator, upgrade_order, upgraded_fields
+from pricing import PriceTable, resolve_currency
+from resilience import CircuitBreaker, DatabaseUnavailable, OrderSpool, SnapshotStore
+from search import SearchIndex
+from static_export import StaticPublisher
+from tracing import TracedRoute
 
 
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Outage handling: per-route Mongo deadlines (seconds), a shared circuit
+# breaker, last-known-good catalog snapshots and a local order spool
+QUERY_TIMEOUTS = {
+    "get_plans": 2.0,
+    "create_order": 5.0,
+    "get_order": 2.0,
+    "confirm_order": 5.0,
+    "get_order_downloads": 2.0,
+    "get_customer_orders": 3.0,
+    "download_file": 2.0,
+    "get_testimonials": 2.0,
+    "create_testimonial": 5.0,
+    "get_admin_stats": 5.0,
+    "create_coupon": 5.0,
+}
+SERVICE_UNAVAILABLE = "Service temporarily unavailable, please try again shortly"
+
+OBJECT_ID_PATTERN = "^[0-9a-fA-F]{24}$"
+
+db_breaker = CircuitBreaker()
+
+# Set up by create_app(): importing this module reads no configuration and
+# opens nothing, so a worker only pays for what it actually uses.
+client = None
+db = None
+FILES_DIR = None
+snapshots = None
+order_spool = None
+write_behind = False
+audit_writer = None
+cache_bus = None
+sales_counters = None
+price_table = None
+order_migrator = None
+static_publisher = None
+
+
+async def db_call(route, operation):
+    return await db_breaker.call(operation, QUERY_TIMEOUTS[route])
 
-# Create the main app without a prefix
-app = FastAPI(title="English Grammar Books API")
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TracedRoute)
+
+
+def require_admin(x_admin_key: Optional[str] = Header(default=None)):
+    # Disabled unless ADMIN_API_KEY is set
+    admin_key = os.environ.get('ADMIN_API_KEY')
+    if not admin_key or not x_admin_key or not secrets.compare_digest(x_admin_key, admin_key):
+        raise HTTPException(status_code=403, detail="Forbidden")
 
 
 # Utility function to convert ObjectId to string
@@ -58,14 +119,21 @@ class Plan(BaseModel):
 class OrderCreate(BaseModel):
     customerEmail: EmailStr
     customerName: str
-    planId: str
+    # Malformed IDs are rejected with a 422 before the handler runs
+    planId: str = Field(pattern=OBJECT_ID_PATTERN)
     paymentProof: Optional[str] = None
     upiTransactionId: Optional[str] = None
     notes: Optional[str] = None
+    # Price the order in this currency (code or symbol), or in the region's
+    # currency; neither means the plan's own prices
+    currency: Optional[str] = None
+    region: Optional[str] = None
+    couponCode: Optional[str] = Field(default=None, pattern=COUPON_CODE_PATTERN)
 
 
 class Order(BaseModel):
     id: Optional[str] = None
+    schemaVersion: int = ORDER_SCHEMA_VERSION
     orderId: str
     customerEmail: str
     customerName: str
@@ -73,6 +141,9 @@ class Order(BaseModel):
     planName: str
     amount: float
     currency: str
+    listPrice: float
+    couponCode: Optional[str] = None
+    discount: float = 0
     paymentStatus: str = "pending"  # pending, confirmed, failed
     paymentProof: Optional[str] = None
     upiTransactionId: Optional[str] = None
@@ -108,6 +179,20 @@ class Testimonial(BaseModel):
     createdAt: datetime = Field(default_factory=datetime.utcnow)
 
 
+class CouponCreate(BaseModel):
+    code: str = Field(pattern=COUPON_CODE_PATTERN)
+    type: Literal["percent", "fixed"]
+    # Percent off, or an amount off in ``currency`` (code or symbol)
+    value: float = Field(gt=0)
+    currency: Optional[str] = None
+    planIds: List[str] = []
+    startsAt: Optional[datetime] = None
+    endsAt: Optional[datetime] = None
+    # None for unlimited
+    maxUses: Optional[int] = Field(default=None, ge=1)
+    isActive: bool = True
+
+
 # Response Models
 class APIResponse(BaseModel):
     success: bool
@@ -115,6 +200,111 @@ class APIResponse(BaseModel):
     data: Optional[dict] = None
 
 
+# Cached catalog, shared by every request in this worker
+async def load_plans():
+    plans_cursor = db.plans.find({"isActive": True})
+    plans = await db_call("get_plans", lambda: plans_cursor.to_list(length=100))
+
+    # Serialize ObjectIds to strings
+    serialized_plans = []
+    for plan in plans:
+        plan_dict = serialize_doc(plan)
+        plan_dict["id"] = plan_dict["_id"]  # Use _id as id
+        del plan_dict["_id"]
+        serialized_plans.append(plan_dict)
+    await snapshots.save("plans", serialized_plans)
+    return serialized_plans
+
+
+async def load_testimonials():
+    testimonials_cursor = db.testimonials.find({"isApproved": True, "isActive": True})
+    testimonials = await db_call("get_testimonials", lambda: testimonials_cursor.to_list(length=100))
+
+    serialized_testimonials = []
+    for testimonial in testimonials:
+        testimonial_dict = serialize_doc(testimonial)
+        testimonial_dict["id"] = testimonial_dict["_id"]
+        del testimonial_dict["_id"]
+        serialized_testimonials.append(testimonial_dict)
+    await snapshots.save("testimonials", serialized_testimonials)
+    return serialized_testimonials
+
+
+async def load_coupons():
+    coupons_cursor = db[COUPONS_COLLECTION].find({"isActive": True}, {"_id": 0})
+    coupons = await db_call("create_order", lambda: coupons_cursor.to_list(length=None))
+
+    coupons_by_code = {coupon["code"]: coupon for coupon in coupons}
+    await snapshots.save("coupons", coupons_by_code)
+    return coupons_by_code
+
+
+catalog_cache = CatalogCache()
+catalog_cache.register("plans", load_plans)
+catalog_cache.register("testimonials", load_testimonials)
+catalog_cache.register(COUPONS_COLLECTION, load_coupons)
+
+
+async def get_catalog(name):
+    try:
+        return await catalog_cache.get(name)
+    except DatabaseUnavailable:
+        # Serve the last known good copy while Mongo is down
+        snapshot = snapshots.load(name)
+        if snapshot is None:
+            raise
+        return snapshot
+
+
+# Plans by id, rebuilt once per catalog snapshot
+plan_index = (None, {})
+
+
+def pricing_currency(currency, region):
+    code = resolve_currency(currency, region)
+    if code is not None and not price_table.supports(code):
+        raise HTTPException(status_code=422, detail="Unsupported currency")
+    return code
+
+
+async def find_cached_plan(plan_id, code=None):
+    """The active plan ``plan_id``, priced in ``code`` when given."""
+    global plan_index
+    # ObjectId hex is case-insensitive; plans are indexed by str(ObjectId)
+    plan_id = plan_id.lower()
+    plans = await get_catalog("plans")
+    if code is not None:
+        return price_table.localized(plans, code)[1].get(plan_id)
+    if plan_index[0] is not plans:
+        plan_index = (plans, {plan["id"]: plan for plan in plans})
+    return plan_index[1].get(plan_id)
+
+
+async def find_order_plan(route, plan_id):
+    # Orders keep working for plans that were deactivated after purchase
+    plan = await find_cached_plan(plan_id)
+    if plan is None and ObjectId.is_valid(plan_id):
+        plan = await db_call(route, lambda: db.plans.find_one({"_id": ObjectId(plan_id)}))
+    return plan
+
+
+# Search runs over the cached catalog; the index re-tokenizes only documents
+# that changed since the last snapshot it saw
+search_index = SearchIndex({
+    "plan": {"name": 3, "description": 1, "features": 1},
+    "testimonial": {"text": 1, "planName": 2, "location": 1, "name": 1},
+})
+
+# Compressed bodies of the catalog endpoints, rebuilt once per snapshot
+precompressed = PrecompressedCache(int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')))
+
+
+def new_order_id():
+    # Millisecond timestamp plus a random suffix, so orders taken in the same
+    # instant, by one busy worker or several, still get distinct IDs
+    return f"ORDER_{int(time.time() * 1000)}{secrets.token_hex(4).upper()}"
+
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -123,63 +313,100 @@ async def root():
 
 # Plans Endpoints
 @api_router.get("/plans")
-async def get_plans():
+async def get_plans(request: Request, currency: Optional[str] = None, region: Optional[str] = None):
+    code = pricing_currency(currency, region)
     try:
-        plans_cursor = db.plans.find({"isActive": True})
-        plans = await plans_cursor.to_list(length=100)
-        
-        # Serialize ObjectIds to strings
-        serialized_plans = []
-        for plan in plans:
-            plan_dict = serialize_doc(plan)
-            plan_dict["id"] = plan_dict["_id"]  # Use _id as id
-            del plan_dict["_id"]
-            serialized_plans.append(plan_dict)
-        
-        return {"success": True, "data": serialized_plans}
+        serialized_plans = await get_catalog("plans")
+        name = "plans"
+        if code is not None:
+            # Converted once per snapshot and rate table, like the compressed bodies
+            serialized_plans, _ = price_table.localized(serialized_plans, code)
+            name = f"plans.{code}"
+        return precompressed.response(
+            name, serialized_plans, lambda plans: {"success": True, "data": plans},
+            request.headers.get("accept-encoding")
+        )
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
     except Exception as e:
-        logging.error(f"Error fetching plans: {e}")
+        logging.error("Error fetching plans: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @api_router.get("/plans/{plan_id}")
-async def get_plan(plan_id: str):
+async def get_plan(plan_id: str, currency: Optional[str] = None, region: Optional[str] = None):
+    code = pricing_currency(currency, region)
     try:
-        plan = await db.plans.find_one({"_id": ObjectId(plan_id), "isActive": True})
+        plan = await find_cached_plan(plan_id, code)
         if not plan:
             raise HTTPException(status_code=404, detail="Plan not found")
-        
-        plan_dict = serialize_doc(plan)
-        plan_dict["id"] = plan_dict["_id"]
-        del plan_dict["_id"]
-        
-        return {"success": True, "data": plan_dict}
+
+        return {"success": True, "data": plan}
+    except HTTPException:
+        raise
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
     except Exception as e:
-        logging.error(f"Error fetching plan {plan_id}: {e}")
+        logging.error("Error fetching plan %s: %s", plan_id, e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+async def release_redeemed_coupon(coupon):
+    try:
+        await db_call("create_order", lambda: release_coupon(db[COUPON_USAGE_COLLECTION], coupon))
+    except Exception as e:
+        logging.error("Error releasing a use of coupon %s: %s", coupon["code"], e)
+
+
 # Orders Endpoints
 @api_router.post("/orders")
 async def create_order(order_data: OrderCreate):
     try:
-        # Get plan details
-        plan = await db.plans.find_one({"_id": ObjectId(order_data.planId), "isActive": True})
+        # Name and price come from the cached catalog (or its snapshot during
+        # an outage), so taking an order costs no plan lookup in Mongo. The
+        # amount is locked in here: later rate changes never touch the order.
+        code = pricing_currency(order_data.currency, order_data.region)
+        plan = await find_cached_plan(order_data.planId, code)
         if not plan:
             raise HTTPException(status_code=404, detail="Plan not found")
+
+        # Coupons are checked against the cached index; only limited-use
+        # coupons need Mongo, to take one use atomically
+        discount = 0
+        coupon_code = None
+        redeemed_coupon = None
+        if order_data.couponCode:
+            coupon_code = normalize_coupon_code(order_data.couponCode)
+            coupon = (await get_catalog(COUPONS_COLLECTION)).get(coupon_code)
+            discount, error = evaluate_coupon(coupon, plan, datetime.utcnow())
+            if error:
+                raise HTTPException(status_code=422, detail=error)
+            if coupon.get("maxUses") is not None:
+                redeemed = await db_call(
+                    "create_order", lambda: redeem_coupon(db[COUPON_USAGE_COLLECTION], coupon)
+                )
+                if not redeemed:
+                    raise HTTPException(status_code=422, detail="Coupon has been fully redeemed")
+                redeemed_coupon = coupon
         
         # Generate unique order ID
-        order_id = f"ORDER_{int(datetime.utcnow().timestamp())}"
+        order_id = new_order_id()
         
-        # Create order document
+        # Create order document; the _id is assigned here so that replaying
+        # it from the order log can never insert it twice
         order_doc = {
+            "_id": ObjectId(),
+            "schemaVersion": ORDER_SCHEMA_VERSION,
             "orderId": order_id,
-            "customerEmail": order_data.customerEmail,
+            "customerEmail": normalize_email(order_data.customerEmail),
             "customerName": order_data.customerName,
-            "planId": order_data.planId,
+            "planId": plan["id"],
             "planName": plan["name"],
-            "amount": plan["price"],
+            "amount": round(plan["price"] - discount, 2),
             "currency": plan["currency"],
+            "listPrice": plan["price"],
+            "couponCode": coupon_code,
+            "discount": discount,
             "paymentStatus": "pending",
             "paymentProof": order_data.paymentProof,
             "upiTransactionId": order_data.upiTransactionId,
@@ -193,49 +420,96 @@ async def create_order(order_data: OrderCreate):
             "updatedAt": datetime.utcnow()
         }
         
-        # Insert order
-        result = await db.orders.insert_one(order_doc)
+        try:
+            if write_behind:
+                # Acknowledge once the order is durable in the local log; the
+                # spool replayer inserts it into Mongo in batches
+                await order_spool.append(order_doc)
+            else:
+                # Insert order; if Mongo is down keep it in the local spool, which
+                # is replayed into Mongo once it recovers
+                try:
+                    await db_call("create_order", lambda: db.orders.insert_one(order_doc))
+                except DatabaseUnavailable as e:
+                    logging.error("Spooling order %s, MongoDB unavailable: %s", order_id, e)
+                    await order_spool.append(order_doc)
+        except Exception:
+            # The order was not taken, so neither is its use of the coupon
+            if redeemed_coupon is not None:
+                await release_redeemed_coupon(redeemed_coupon)
+            raise
+        sales_counters.order_created(order_doc)
         
         return {
             "success": True, 
             "data": {
                 "orderId": order_id,
+                "amount": order_doc["amount"],
+                "currency": order_doc["currency"],
                 "message": "Order created successfully. You will receive download links within 2-4 hours after payment confirmation."
             }
         }
         
+    except HTTPException:
+        raise
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
     except Exception as e:
-        logging.error(f"Error creating order: {e}")
+        logging.error("Error creating order: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @api_router.get("/orders/{order_id}")
 async def get_order(order_id: str):
     try:
-        order = await db.orders.find_one({"orderId": order_id, "isActive": True})
+        # Orders still in this worker's local log are not in Mongo yet
+        order = order_spool.pending.get(order_id)
+        if order is not None:
+            order = dict(order)
+        else:
+            order = await db_call("get_order", lambda: db.orders.find_one({"orderId": order_id, "isActive": True}))
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
+        order = upgrade_order(order)
         
         order_dict = serialize_doc(order)
         order_dict["id"] = order_dict["_id"]
         del order_dict["_id"]
         
         return {"success": True, "data": order_dict}
+    except HTTPException:
+        raise
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
     except Exception as e:
-        logging.error(f"Error fetching order {order_id}: {e}")
+        logging.error("Error fetching order %s: %s", order_id, e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-@api_router.put("/orders/{order_id}/confirm")
+# Payment is checked by hand, so only admins confirm orders and release downloads
+@api_router.put("/orders/{order_id}/confirm", dependencies=[Depends(require_admin)])
 async def confirm_order(order_id: str):
     try:
         # Find order
-        order = await db.orders.find_one({"orderId": order_id, "isActive": True})
-        if not order:
+        stored = await db_call("confirm_order", lambda: db.orders.find_one({"orderId": order_id, "isActive": True}))
+        if not stored:
             raise HTTPException(status_code=404, detail="Order not found")
+        order = upgrade_order(stored)
+
+        # Confirming twice must not issue a second set of links
+        if order.get("paymentStatus") == "confirmed":
+            # Catches up the summary when recording it failed the first time
+            await db_call("confirm_order", lambda: record_confirmed_order(db[SUMMARY_COLLECTION], order))
+            return {
+                "success": True,
+                "data": {
+                    "downloadLinks": order.get("downloadLinks", []),
+                    "message": "Order already confirmed"
+                }
+            }
         
         # Generate download links (mock for now)
-        plan = await db.plans.find_one({"_id": ObjectId(order["planId"])})
+        plan = await find_order_plan("confirm_order", order["planId"])
         download_links = []
         
         if plan:
@@ -245,17 +519,27 @@ async def confirm_order(order_id: str):
                 download_url = f"/api/downloads/{order_id}/{download_token}"
                 download_links.append(download_url)
         
-        # Update order status
+        # Update order status; an order in an old schema is stored upgraded
+        now = datetime.utcnow()
         update_data = {
+            **upgraded_fields(stored, order),
             "paymentStatus": "confirmed",
             "downloadLinks": download_links,
-            "updatedAt": datetime.utcnow()
+            "confirmedAt": now,
+            "updatedAt": now
         }
         
-        await db.orders.update_one(
-            {"orderId": order_id}, 
+        result = await db_call("confirm_order", lambda: db.orders.update_one(
+            {"orderId": order_id, "paymentStatus": {"$ne": "confirmed"}}, 
             {"$set": update_data}
-        )
+        ))
+        if result.modified_count == 0:
+            # A concurrent confirmation won; report its links
+            order = upgrade_order(await db_call("confirm_order", lambda: db.orders.find_one({"orderId": order_id})))
+            download_links = order.get("downloadLinks", [])
+        else:
+            sales_counters.order_confirmed(order, now)
+            await db_call("confirm_order", lambda: record_confirmed_order(db[SUMMARY_COLLECTION], order))
         
         return {
             "success": True, 
@@ -265,28 +549,134 @@ async def confirm_order(order_id: str):
             }
         }
         
+    except HTTPException:
+        raise
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
+    except Exception as e:
+        logging.error("Error confirming order %s: %s", order_id, e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# Client IPs included, so only for admins
+@api_router.get("/orders/{order_id}/downloads", dependencies=[Depends(require_admin)])
+async def get_order_downloads(order_id: str, limit: int = 100):
+    try:
+        events = await db_call(
+            "get_order_downloads",
+            lambda: get_download_events(db[AUDIT_COLLECTION], order_id, min(max(limit, 1), 500))
+        )
+        return {"success": True, "data": events}
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
     except Exception as e:
-        logging.error(f"Error confirming order {order_id}: {e}")
+        logging.error("Error fetching downloads for order %s: %s", order_id, e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# Customer Endpoints
+@api_router.get("/customers/{email}/orders")
+async def get_customer_orders(
+    email: str,
+    token: str,
+    page: int = Query(default=1, ge=1),
+    limit: int = Query(default=20, ge=1, le=100)
+):
+    if not magic_links_enabled():
+        raise HTTPException(status_code=404, detail="Not found")
+    if not verify_customer_token(token, email):
+        raise HTTPException(status_code=401, detail="Invalid or expired link")
+    try:
+        history = await db_call(
+            "get_customer_orders",
+            lambda: get_customer_history(db.orders, db[SUMMARY_COLLECTION], email, page, limit)
+        )
+        return {"success": True, "data": history}
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
+    except Exception as e:
+        logging.error("Error fetching orders for customer %s: %s", email, e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# Sent to the customer out of band, e.g. by email, never by the storefront
+@api_router.post("/admin/customers/{email}/magic-link", dependencies=[Depends(require_admin)])
+async def create_customer_magic_link(email: str):
+    if not magic_links_enabled():
+        raise HTTPException(status_code=404, detail="Not found")
+    return {"success": True, "data": {"email": normalize_email(email), "ordersUrl": customer_orders_url(email)}}
+
+
+# Downloads Endpoints
+async def record_download(order_id, file_name, ip, bytes_sent, started):
+    # Runs after the file has been sent, so the duration covers the transfer
+    await audit_writer.record(order_id, file_name, ip, bytes_sent, (time.perf_counter() - started) * 1000)
+
+
+@api_router.get("/downloads/{order_id}/{token}")
+async def download_file(order_id: str, token: str, request: Request):
+    started = time.perf_counter()
+    try:
+        order = await db_call("download_file", lambda: db.orders.find_one({"orderId": order_id, "isActive": True}))
+        download_url = f"/api/downloads/{order_id}/{token}"
+        if order:
+            order = upgrade_order(order)
+        if not order or order.get("paymentStatus") != "confirmed" or download_url not in order.get("downloadLinks", []):
+            raise HTTPException(status_code=404, detail="Download not found")
+
+        if order["expiresAt"] < datetime.utcnow():
+            raise HTTPException(status_code=410, detail="Download link has expired")
+
+        # Links are generated in the same order as the plan's downloadFiles
+        plan = await find_order_plan("download_file", order["planId"])
+        download_files = plan.get("downloadFiles", []) if plan else []
+        link_index = order["downloadLinks"].index(download_url)
+        if link_index >= len(download_files):
+            raise HTTPException(status_code=404, detail="Download not found")
+
+        file_path = FILES_DIR / Path(download_files[link_index]).name
+        if not file_path.is_file():
+            raise HTTPException(status_code=404, detail="Download not found")
+
+        # Claim a download atomically so concurrent requests cannot exceed the limit
+        result = await db_call("download_file", lambda: db.orders.update_one(
+            {"orderId": order_id, "downloadCount": {"$lt": order.get("maxDownloads", 5)}},
+            {"$inc": {"downloadCount": 1}, "$set": {"updatedAt": datetime.utcnow()}}
+        ))
+        if result.modified_count == 0:
+            raise HTTPException(status_code=403, detail="Download limit reached")
+
+        client_ip = request.client.host if request.client else None
+        return FileResponse(
+            file_path,
+            filename=file_path.name,
+            background=BackgroundTask(
+                record_download, order_id, file_path.name, client_ip, file_path.stat().st_size, started
+            )
+        )
+
+    except HTTPException:
+        raise
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
+    except Exception as e:
+        logging.error("Error serving download for order %s: %s", order_id, e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 # Testimonials Endpoints
 @api_router.get("/testimonials")
-async def get_testimonials():
+async def get_testimonials(request: Request):
     try:
-        testimonials_cursor = db.testimonials.find({"isApproved": True, "isActive": True})
-        testimonials = await testimonials_cursor.to_list(length=100)
-        
-        serialized_testimonials = []
-        for testimonial in testimonials:
-            testimonial_dict = serialize_doc(testimonial)
-            testimonial_dict["id"] = testimonial_dict["_id"]
-            del testimonial_dict["_id"]
-            serialized_testimonials.append(testimonial_dict)
-        
-        return {"success": True, "data": serialized_testimonials}
+        serialized_testimonials = await get_catalog("testimonials")
+        return precompressed.response(
+            "testimonials", serialized_testimonials, lambda testimonials: {"success": True, "data": testimonials},
+            request.headers.get("accept-encoding")
+        )
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
     except Exception as e:
-        logging.error(f"Error fetching testimonials: {e}")
+        logging.error("Error fetching testimonials: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
@@ -304,36 +694,289 @@ async def create_testimonial(testimonial_data: TestimonialCreate):
             "createdAt": datetime.utcnow()
         }
         
-        result = await db.testimonials.insert_one(testimonial_doc)
+        await db_call("create_testimonial", lambda: db.testimonials.insert_one(testimonial_doc))
         
         return {
             "success": True, 
             "message": "Thank you for your feedback! Your testimonial is under review."
         }
         
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
     except Exception as e:
-        logging.error(f"Error creating testimonial: {e}")
+        logging.error("Error creating testimonial: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-# Include the router in the main app
-app.include_router(api_router)
+# Search Endpoints
+@api_router.get("/search")
+async def search(
+    q: str = Query(min_length=1, max_length=200),
+    type: Optional[str] = Query(default=None, pattern="^(plan|testimonial)$"),
+    page: int = Query(default=1, ge=1),
+    limit: int = Query(default=10, ge=1, le=50)
+):
+    try:
+        search_index.sync("plan", await get_catalog("plans"))
+        search_index.sync("testimonial", await get_catalog("testimonials"))
+
+        total, hits = search_index.search(q, {type} if type else None, (page - 1) * limit, limit)
+        results = [
+            {"type": kind, "score": round(score, 4), "matches": matches, "data": doc}
+            for score, kind, doc, matches in hits
+        ]
+        return {"success": True, "data": {"results": results, "total": total, "page": page, "limit": limit}}
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
+    except Exception as e:
+        logging.error("Error searching for %r: %s", q, e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# Admin Endpoints
+@api_router.get("/admin/stats", dependencies=[Depends(require_admin)])
+async def get_admin_stats(start: Optional[date] = None, end: Optional[date] = None):
+    """Sales per plan per day, conversion and revenue by currency; defaults to the last 30 days."""
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=29)
+    if start > end or (end - start).days > 366:
+        raise HTTPException(status_code=422, detail="start must be on or before end, at most 366 days apart")
+    try:
+        stats = await db_call(
+            "get_admin_stats", lambda: get_sales_stats(db[STATS_COLLECTION], start.isoformat(), end.isoformat())
+        )
+        return {"success": True, "data": stats}
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
+    except Exception as e:
+        logging.error("Error fetching sales stats: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@api_router.post("/admin/coupons", dependencies=[Depends(require_admin)])
+async def create_coupon(coupon_data: CouponCreate):
+    coupon_doc = coupon_data.model_dump()
+    coupon_doc["code"] = normalize_coupon_code(coupon_doc["code"])
+    # Times without an offset are taken as UTC
+    for field in ("startsAt", "endsAt"):
+        coupon_doc[field] = naive_utc(coupon_doc[field])
+    if coupon_doc["type"] == "percent" and coupon_doc["value"] > 100:
+        raise HTTPException(status_code=422, detail="A percent coupon takes at most 100% off")
+    if coupon_doc["type"] == "fixed":
+        if not coupon_doc["currency"] or not price_table.supports(resolve_currency(coupon_doc["currency"])):
+            raise HTTPException(status_code=422, detail="A fixed coupon needs a supported currency")
+        coupon_doc["currency"] = resolve_currency(coupon_doc["currency"])
+    try:
+        coupon_doc["createdAt"] = datetime.utcnow()
+        await db_call("create_coupon", lambda: db[COUPONS_COLLECTION].insert_one(coupon_doc))
+        if coupon_doc["maxUses"] is not None:
+            # Created up front so the first concurrent redemptions never race on the upsert
+            await db_call("create_coupon", lambda: db[COUPON_USAGE_COLLECTION].update_one(
+                {"_id": coupon_doc["code"]}, {"$setOnInsert": {"used": 0}}, upsert=True
+            ))
+        # Workers drop their cached coupons, as they do for catalog edits
+        await db_call("create_coupon", lambda: bump_cache_version(db, COUPONS_COLLECTION))
+        del coupon_doc["_id"]
+        return {"success": True, "data": coupon_doc}
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Coupon code already exists")
+    except DatabaseUnavailable:
+        raise HTTPException(status_code=503, detail=SERVICE_UNAVAILABLE)
+    except Exception as e:
+        logging.error("Error creating coupon: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
+log_listener = None
+
+
+async def start_logging():
+    # Per worker: the listener thread would not survive gunicorn's fork.
+    # LOG_FORMAT is "json" or "text"; LOG_RATE_LIMIT caps identical messages per minute.
+    global log_listener
+    log_listener = configure_logging(
+        level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+        fmt=os.environ.get('LOG_FORMAT', 'json'),
+        burst=int(os.environ.get('LOG_RATE_LIMIT', '20'))
+    )
+
+
+async def stop_logging():
+    global log_listener
+    if log_listener is not None:
+        # Writes out whatever is still queued
+        log_listener.stop()
+        log_listener = None
+
+
+async def seed_memory_database():
+    from init_db import seed_database
+
+    plans_diff, testimonials_diff = await seed_database(db)
+    logger.info(
+        "Seeded in-memory database with %s plans and %s testimonials",
+        len(plans_diff["added"]), len(testimonials_diff["added"])
+    )
+
+
+async def start_background_tasks():
+    audit_writer.start()
+    cache_bus.start()
+    order_spool.start(db.orders, db_breaker)
+    sales_counters.start(db_breaker)
+    price_table.start()
+    if order_migrator is not None:
+        order_migrator.start(db_breaker)
+    if static_publisher is not None:
+        static_publisher.start()
+
 
-@app.on_event("shutdown")
 async def shutdown_db_client():
+    await cache_bus.close()
+    await order_spool.close()
+    await sales_counters.close()
+    await price_table.close()
+    if order_migrator is not None:
+        await order_migrator.close()
+    if static_publisher is not None:
+        await static_publisher.close()
+    await audit_writer.close()
     client.close()
+
+
+def create_app():
+    """Build the API: load settings, create the Mongo client and wire up subsystems."""
+    global client, db, FILES_DIR, snapshots, order_spool, write_behind, audit_writer, cache_bus, sales_counters
+    global price_table, order_migrator, static_publisher
+
+    # Only pulled in when an app is actually built
+    from dotenv import load_dotenv
+    from audit import DownloadAuditWriter
+    from storage import create_client, is_memory_url
+
+    load_dotenv(ROOT_DIR / '.env')
+
+    # Tracing is off unless an exporter is configured: TRACING_EXPORTER is
+    # "console" or a file path, TRACE_SAMPLE_RATE the fraction of requests kept
+    tracing_exporter = os.environ.get('TRACING_EXPORTER')
+    event_listeners = []
+    if tracing_exporter:
+        import tracing
+        exporter = (
+            tracing.ConsoleSpanExporter() if tracing_exporter == 'console'
+            else tracing.FileSpanExporter(tracing_exporter)
+        )
+        tracing.configure(exporter, float(os.environ.get('TRACE_SAMPLE_RATE', '0.01')))
+        event_listeners.append(tracing.MongoCommandTracer())
+
+    # MongoDB connection; MONGO_URL=memory:// keeps everything in this process
+    # (one worker only), seeded with the catalog on startup.
+    # connect=False: with a preloaded multi-worker app the client is created
+    # before fork, so connections must only be opened inside each worker.
+    mongo_url = os.environ['MONGO_URL']
+    client = create_client(
+        mongo_url,
+        connect=False,
+        serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '3000')),
+        event_listeners=event_listeners
+    )
+    db = client[os.environ['DB_NAME']]
+    # Nothing cached for a previously built app belongs to this database
+    catalog_cache.invalidate_all()
+
+    # Purchased files are served from here, never from a public directory
+    FILES_DIR = Path(os.environ.get('FILES_DIR', ROOT_DIR / 'files'))
+
+    data_dir = Path(os.environ.get('DATA_DIR', ROOT_DIR / 'var'))
+    snapshots = SnapshotStore(data_dir / 'snapshots')
+    # ORDER_WRITE_BEHIND=1 acknowledges orders once they are in the local
+    # log and batches them into Mongo, instead of one insert per request
+    write_behind = os.environ.get('ORDER_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+    order_spool = OrderSpool(data_dir / 'order_log', replay_interval=0.2 if write_behind else 5.0)
+
+    audit_writer = DownloadAuditWriter(db[AUDIT_COLLECTION])
+    # Polling only, for servers without change streams: how often to check
+    # cache_versions, and how long a catalog may go without a full reload
+    cache_bus = CacheInvalidationBus(
+        db, catalog_cache,
+        poll_interval=float(os.environ.get('CACHE_POLL_INTERVAL', '0.2')),
+        max_age=float(os.environ.get('CATALOG_MAX_AGE', '30'))
+    )
+    sales_counters = SalesCounters(db[STATS_COLLECTION])
+
+    # Local exchange-rate table, kept fresh by refresh_exchange_rates.py
+    price_table = PriceTable(os.environ.get('EXCHANGE_RATES_FILE', ROOT_DIR / 'exchange_rates.json'))
+    price_table.reload()
+
+    # Orders are upgraded to the current schema as they are read;
+    # ORDER_MIGRATION=1 also rewrites stored ones in the background, at most
+    # ORDER_MIGRATION_BATCH orders every ORDER_MIGRATION_INTERVAL seconds
+    order_migrator = None
+    if os.environ.get('ORDER_MIGRATION', '').lower() in ('1', 'true', 'yes'):
+        order_migrator = OrderMigrator(
+            db.orders,
+            db[MIGRATIONS_COLLECTION],
+            batch_size=int(os.environ.get('ORDER_MIGRATION_BATCH', '100')),
+            interval=float(os.environ.get('ORDER_MIGRATION_INTERVAL', '1.0'))
+        )
+
+    # STATIC_EXPORT_DIR: where plans and testimonials are published as static
+    # JSON whenever they change, for a web server or CDN to serve
+    static_export_dir = os.environ.get('STATIC_EXPORT_DIR')
+    static_publisher = StaticPublisher(static_export_dir, catalog_cache, get_catalog) if static_export_dir else None
+
+    # Create the main app without a prefix
+    app = FastAPI(title="English Grammar Books API")
+
+    # Include the router in the main app
+    app.include_router(api_router)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Other API responses are compressed on the fly; responses that are
+    # already encoded (the precompressed catalog) pass through untouched, and
+    # downloads are sent as they are, with their Content-Length
+    app.add_middleware(
+        SelectiveGZipMiddleware,
+        exclude_prefixes=("/api/downloads/",),
+        minimum_size=int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+        compresslevel=6
+    )
+
+    if tracing_exporter:
+        # Wraps everything else, including CORS
+        from tracing import TracingMiddleware
+        app.add_middleware(TracingMiddleware)
+
+    # Outermost, so every log line of a request carries its ID
+    app.add_middleware(RequestIdMiddleware)
+
+    app.add_event_handler("startup", start_logging)
+    if tracing_exporter:
+        app.add_event_handler("startup", tracing.tracer.start)
+
+    if is_memory_url(mongo_url):
+        app.add_event_handler("startup", seed_memory_database)
+    app.add_event_handler("startup", start_background_tasks)
+    app.add_event_handler("shutdown", shutdown_db_client)
+    if tracing_exporter:
+        app.add_event_handler("shutdown", tracing.tracer.stop)
+    app.add_event_handler("shutdown", stop_logging)
+    return app
+
+
+def __getattr__(name):
+    # Keeps `uvicorn server:app` working: the app is built on first access.
+    # Prefer `uvicorn --factory server:create_app`.
+    global app
+    if name == "app":
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,143 @@
+"""Static export of the catalog for the frontend and a CDN.
+
+Plans and approved testimonials are published as JSON files named after a
+hash of their content (``plans.3f9c0a1b2d4e5f60.json``), with the same body
+as the API returns, next to gzip (and, with ``brotli`` installed, brotli)
+variants for servers that send precompressed files. ``manifest.json`` maps
+each name to its current file. The hashed files never change, so they can
+be cached for a year (``Cache-Control: public, max-age=31536000,
+immutable``); only the manifest needs a short lifetime, e.g. 60 seconds.
+
+A new version is written whenever the catalog cache entry is invalidated,
+which happens on every write to ``plans``/``testimonials`` (see cache.py).
+Every worker publishes, and they all render the same files: a file that
+exists is never rewritten and the manifest only when it changes. The last
+few versions of each file are kept for clients still holding an older
+manifest.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+
+from compression import compress_variants, render_json
+
+
+EXPORTED = ("plans", "testimonials")
+MANIFEST = "manifest.json"
+VARIANT_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+
+def _write_new(path, data):
+    # Written under a per-process name, so workers publishing at once never
+    # see each other's partial files
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+class StaticPublisher:
+    def __init__(self, directory, cache, load, names=EXPORTED, keep=5, delay=1.0):
+        self.directory = Path(directory)
+        self.cache = cache
+        # Loads a catalog entry by name, falling back to its snapshot
+        self.load = load
+        self.names = names
+        self.keep = keep
+        # Writes arriving together are published once
+        self.delay = delay
+        self.files = {}
+        self._dirty = set(names)
+        self._wake = asyncio.Event()
+        self._task = None
+        self._closing = False
+
+    def notify(self, name):
+        if name in self.names:
+            self._dirty.add(name)
+            self._wake.set()
+
+    def _write_version(self, name, data):
+        body = render_json({"success": True, "data": data})
+        filename = f"{name}.{hashlib.sha256(body).hexdigest()[:16]}.json"
+        path = self.directory / filename
+        if not path.is_file():
+            for encoding, variant in compress_variants(body).items():
+                if encoding in VARIANT_SUFFIXES:
+                    _write_new(path.with_name(filename + VARIANT_SUFFIXES[encoding]), variant)
+            # The plain file last: once it exists, the version is complete
+            _write_new(path, body)
+        return filename
+
+    def _write_manifest(self):
+        path = self.directory / MANIFEST
+        try:
+            if json.loads(path.read_text())["files"] == self.files:
+                return False
+        except (OSError, ValueError, KeyError):
+            pass
+        manifest = {"publishedAt": datetime.utcnow().isoformat(timespec="seconds") + "Z", "files": self.files}
+        _write_new(path, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+        return True
+
+    def _prune(self, name):
+        versions = sorted(self.directory.glob(f"{name}.*.json"), key=lambda path: path.stat().st_mtime, reverse=True)
+        for path in versions[self.keep:]:
+            if path.name == self.files.get(name):
+                continue
+            for stale in (path, *(path.with_name(path.name + suffix) for suffix in VARIANT_SUFFIXES.values())):
+                stale.unlink(missing_ok=True)
+
+    async def publish(self):
+        """Write the catalog entries changed since the last publish; True when the manifest changed."""
+        names, self._dirty = self._dirty, set()
+        try:
+            for name in names:
+                data = await self.load(name)
+                self.files[name] = await asyncio.to_thread(self._write_version, name, data)
+        except Exception:
+            # Retried on the next change or attempt
+            self._dirty |= names
+            raise
+        if len(self.files) < len(self.names):
+            return False
+        changed = await asyncio.to_thread(self._write_manifest)
+        if changed:
+            for name in names:
+                await asyncio.to_thread(self._prune, name)
+            logging.info("Published static catalog %s", ", ".join(self.files[name] for name in sorted(names)))
+        return changed
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.cache.listeners.append(self.notify)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.notify in self.cache.listeners:
+            self.cache.listeners.remove(self.notify)
+        if self._task is not None:
+            self._closing = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while not self._closing:
+            if not self._dirty:
+                await self._wake.wait()
+            self._wake.clear()
+            await asyncio.sleep(self.delay)
+            try:
+                await self.publish()
+            except Exception as e:
+                logging.error("Error publishing static catalog: %s", e)
+                await asyncio.sleep(5.0)
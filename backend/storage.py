@@ -0,0 +1,524 @@
+"""Storage backends: MongoDB through Motor, or an in-memory stand-in.
+
+``create_client`` returns a Motor client for ``mongodb://`` URLs and a
+``MemoryClient`` for ``memory://``. The in-memory backend implements the
+part of Motor's collection API this app uses, with the same semantics for
+the things that matter to correctness: unique indexes raise
+``DuplicateKeyError``/``BulkWriteError``, each update is applied atomically
+to one document, and cursors return copies, so callers can never mutate
+stored documents. Documents and filters go through a BSON round trip, so
+values come back as the driver returns them: datetimes naive UTC truncated
+to milliseconds, tuples as lists, and unencodable values rejected. It keeps everything in one process, so run a single
+worker with it; it exists for hermetic tests and benchmarks.
+"""
+
+import copy
+import itertools
+
+from bson import BSON, ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+
+MEMORY_URL_SCHEME = "memory://"
+
+_MISSING = object()
+
+
+def create_client(url, **kwargs):
+    if url.startswith(MEMORY_URL_SCHEME):
+        return MemoryClient(url)
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(url, **kwargs)
+
+
+def is_memory_url(url):
+    return url.startswith(MEMORY_URL_SCHEME)
+
+
+def _bson_copy(doc):
+    # What MongoDB would store for ``doc``, decoded the way Motor returns it
+    return BSON.encode(doc).decode()
+
+
+# Query matching
+
+def _get_path(doc, path):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+
+def _equals(value, target):
+    if value is _MISSING:
+        return target is None
+    if isinstance(value, list) and not isinstance(target, list):
+        return target in value
+    return value == target
+
+
+def _candidates(value):
+    if value is _MISSING:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _compare(value, target, op):
+    for candidate in _candidates(value):
+        try:
+            if op(candidate, target):
+                return True
+        except TypeError:
+            # Mongo only compares values of the same type
+            continue
+    return False
+
+
+_COMPARISONS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+
+def _match_condition(value, condition):
+    if not (isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition)):
+        return _equals(value, condition)
+    for op, target in condition.items():
+        if op == "$eq":
+            matched = _equals(value, target)
+        elif op == "$ne":
+            matched = not _equals(value, target)
+        elif op in _COMPARISONS:
+            matched = _compare(value, target, _COMPARISONS[op])
+        elif op == "$in":
+            matched = any(_equals(value, item) for item in target)
+        elif op == "$nin":
+            matched = not any(_equals(value, item) for item in target)
+        elif op == "$exists":
+            matched = (value is not _MISSING) == bool(target)
+        elif op == "$not":
+            matched = not _match_condition(value, target)
+        else:
+            raise OperationFailure(f"unknown operator: {op}")
+        if not matched:
+            return False
+    return True
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(doc, sub_query) for sub_query in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub_query) for sub_query in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, sub_query) for sub_query in condition):
+                return False
+        elif not _match_condition(_get_path(doc, key), condition):
+            return False
+    return True
+
+
+# Updates
+
+def _set_path(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def apply_update(doc, update, is_insert=False):
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not is_insert:
+            continue
+        for path, value in fields.items():
+            current = _get_path(doc, path)
+            if op in ("$set", "$setOnInsert"):
+                _set_path(doc, path, copy.deepcopy(value))
+            elif op == "$unset":
+                _unset_path(doc, path)
+            elif op == "$inc":
+                _set_path(doc, path, (0 if current is _MISSING else current) + value)
+            elif op == "$max":
+                if current is _MISSING or value > current:
+                    _set_path(doc, path, value)
+            elif op == "$min":
+                if current is _MISSING or value < current:
+                    _set_path(doc, path, value)
+            elif op in ("$push", "$addToSet"):
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                array = [] if current is _MISSING else current
+                for item in items:
+                    if op == "$push" or item not in array:
+                        array.append(copy.deepcopy(item))
+                _set_path(doc, path, array)
+            else:
+                raise OperationFailure(f"Unknown modifier: {op}")
+
+
+def _upsert_seed(query):
+    seed = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            if "$eq" in condition:
+                _set_path(seed, key, copy.deepcopy(condition["$eq"]))
+            continue
+        _set_path(seed, key, copy.deepcopy(condition))
+    return seed
+
+
+# Projection and sorting
+
+def project(doc, projection):
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if any(fields.values()):
+        result = {key: doc[key] for key in fields if key in doc}
+        if include_id and "_id" in doc:
+            result = {"_id": doc["_id"], **result}
+        return result
+    result = {key: value for key, value in doc.items() if key not in fields}
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def _sort_key(value):
+    # Missing and null sort first, as in MongoDB
+    if value is _MISSING or value is None:
+        return (0,)
+    return (1, value)
+
+
+def _normalize_sort(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    return list(key_or_list)
+
+
+class MemoryCursor:
+    def __init__(self, docs, projection):
+        self._docs = docs
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        for key, direction in reversed(_normalize_sort(key_or_list, direction)):
+            self._docs.sort(key=lambda doc: _sort_key(_get_path(doc, key)), reverse=direction == -1)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def _iter_results(self):
+        if self._results is None:
+            docs = self._docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._results = iter([project(copy.deepcopy(doc), self._projection) for doc in docs])
+        return self._results
+
+    async def to_list(self, length=None):
+        results = self._iter_results()
+        return list(results) if length is None else list(itertools.islice(results, length))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter_results())
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _UniqueIndex:
+    def __init__(self, name, keys, sparse):
+        self.name = name
+        self.keys = keys
+        self.sparse = sparse
+        self.entries = {}
+
+    def key_for(self, doc):
+        values = [_get_path(doc, key) for key in self.keys]
+        if self.sparse and all(value is _MISSING for value in values):
+            return None
+        return repr([None if value is _MISSING else value for value in values])
+
+
+class MemoryCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self._docs = {}
+        self._unique = {"_id_": _UniqueIndex("_id_", ["_id"], False)}
+        self.indexes = {"_id_": {"key": [("_id", 1)], "unique": True}}
+
+    @property
+    def full_name(self):
+        return f"{self.database.name}.{self.name}"
+
+    # Indexes
+
+    async def create_index(self, keys, unique=False, sparse=False, name=None, **options):
+        keys = _normalize_sort(keys, 1)
+        name = name or "_".join(f"{key}_{direction}" for key, direction in keys)
+        if unique and name not in self._unique:
+            index = _UniqueIndex(name, [key for key, _ in keys], sparse)
+            for doc in self._docs.values():
+                key = index.key_for(doc)
+                if key is None:
+                    continue
+                if key in index.entries:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.full_name} index: {name}", 11000)
+                index.entries[key] = doc["_id"]
+            self._unique[name] = index
+        self.indexes[name] = {"key": keys, "unique": unique, "sparse": sparse, **options}
+        return name
+
+    async def index_information(self):
+        return copy.deepcopy(self.indexes)
+
+    def _check_unique(self, doc, own_id=None):
+        for index in self._unique.values():
+            key = index.key_for(doc)
+            if key is not None and index.entries.get(key, own_id) != own_id:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.full_name} index: {index.name} dup key: {key}",
+                    11000
+                )
+
+    def _index_doc(self, doc):
+        for index in self._unique.values():
+            key = index.key_for(doc)
+            if key is not None:
+                index.entries[key] = doc["_id"]
+
+    def _unindex_doc(self, doc):
+        for index in self._unique.values():
+            key = index.key_for(doc)
+            if key is not None and index.entries.get(key) == doc["_id"]:
+                del index.entries[key]
+
+    # Writes
+
+    def _insert(self, document):
+        if "_id" not in document:
+            # Like pymongo, the caller's document gets the generated _id
+            document["_id"] = ObjectId()
+        doc = _bson_copy(document)
+        self._check_unique(doc)
+        self._docs[doc["_id"]] = doc
+        self._index_doc(doc)
+        return doc["_id"]
+
+    async def insert_one(self, document, **kwargs):
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents, ordered=True, **kwargs):
+        inserted_ids = []
+        errors = []
+        for index, document in enumerate(documents):
+            try:
+                inserted_ids.append(self._insert(document))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors, "writeConcernErrors": [], "nInserted": len(inserted_ids),
+                "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []
+            })
+        return InsertManyResult(inserted_ids, True)
+
+    def _update(self, query, update, upsert, many):
+        query, update = _bson_copy(query), _bson_copy(update)
+        matched = modified = 0
+        for doc in [doc for doc in self._docs.values() if matches(doc, query)]:
+            matched += 1
+            updated = copy.deepcopy(doc)
+            apply_update(updated, update)
+            if updated == doc:
+                if not many:
+                    break
+                continue
+            if updated["_id"] != doc["_id"]:
+                raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'", 66)
+            self._unindex_doc(doc)
+            try:
+                self._check_unique(updated, own_id=doc["_id"])
+            except DuplicateKeyError:
+                self._index_doc(doc)
+                raise
+            self._docs[doc["_id"]] = updated
+            self._index_doc(updated)
+            modified += 1
+            if not many:
+                break
+
+        raw_result = {"n": matched, "nModified": modified, "updatedExisting": matched > 0}
+        if matched == 0 and upsert:
+            doc = _upsert_seed(query)
+            apply_update(doc, update, is_insert=True)
+            raw_result["upserted"] = self._insert(doc)
+            raw_result["n"] = 1
+        return raw_result
+
+    async def update_one(self, filter, update, upsert=False, **kwargs):
+        return UpdateResult(self._update(filter, update, upsert, many=False), True)
+
+    async def update_many(self, filter, update, upsert=False, **kwargs):
+        return UpdateResult(self._update(filter, update, upsert, many=True), True)
+
+    def _delete(self, query, many):
+        query = _bson_copy(query)
+        deleted = 0
+        for doc in [doc for doc in self._docs.values() if matches(doc, query)]:
+            self._unindex_doc(doc)
+            del self._docs[doc["_id"]]
+            deleted += 1
+            if not many:
+                break
+        return {"n": deleted}
+
+    async def delete_one(self, filter, **kwargs):
+        return DeleteResult(self._delete(filter, many=False), True)
+
+    async def delete_many(self, filter, **kwargs):
+        return DeleteResult(self._delete(filter, many=True), True)
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        result = {
+            "writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+            "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []
+        }
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    result["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    raw = self._update(
+                        request._filter, request._doc, request._upsert, many=isinstance(request, UpdateMany)
+                    )
+                    if "upserted" in raw:
+                        result["nUpserted"] += 1
+                        result["upserted"].append({"index": index, "_id": raw["upserted"]})
+                    else:
+                        result["nMatched"] += raw["n"]
+                        result["nModified"] += raw["nModified"]
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    result["nRemoved"] += self._delete(request._filter, many=isinstance(request, DeleteMany))["n"]
+                else:
+                    raise OperationFailure(f"Unsupported bulk operation: {type(request).__name__}")
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    # Reads
+
+    def find(self, filter=None, projection=None, **kwargs):
+        filter = _bson_copy(filter or {})
+        return MemoryCursor([doc for doc in self._docs.values() if matches(doc, filter)], projection)
+
+    async def find_one(self, filter=None, projection=None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        filter = _bson_copy(filter or {})
+        for doc in self._docs.values():
+            if matches(doc, filter):
+                return project(copy.deepcopy(doc), projection)
+        return None
+
+    async def count_documents(self, filter, **kwargs):
+        filter = _bson_copy(filter)
+        return sum(1 for doc in self._docs.values() if matches(doc, filter))
+
+    def watch(self, *args, **kwargs):
+        return self.database.watch()
+
+
+class MemoryDatabase:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self, **kwargs):
+        return list(self._collections)
+
+    async def create_collection(self, name, **options):
+        if name in self._collections:
+            raise CollectionInvalid(f"collection {name} already exists")
+        # Capping is not enforced in memory
+        return self[name]
+
+    def watch(self, *args, **kwargs):
+        # Same answer as a standalone mongod, so callers fall back to polling
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", 40573)
+
+
+class MemoryClient:
+    def __init__(self, url=MEMORY_URL_SCHEME):
+        self.url = url
+        self._databases = {}
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(self, name)
+        return self._databases[name]
+
+    def get_database(self, name):
+        return self[name]
+
+    def close(self):
+        pass
@@ -0,0 +1,312 @@
+"""Request tracing with OpenTelemetry-style spans, exported offline.
+
+A sampled request produces one trace with these spans:
+
+- ``routing``: middleware entry until the route handler starts
+- ``validate request``: body parsing and pydantic validation
+- ``handler``: the endpoint itself, with one ``mongo <command>`` child per
+  driver command (recorded by a pymongo ``CommandListener``)
+- ``encode response``: serializing the endpoint's return value
+
+Finished traces are written as JSON lines using OTLP field names
+(traceId, spanId, parentSpanId, startTimeUnixNano, ...) to stdout or a file,
+from a background thread fed by a bounded queue, so requests never wait on
+the write; traces are dropped when the queue is full.
+Sampling honours an incoming W3C ``traceparent`` header and otherwise keeps
+``sample_rate`` of requests. Unsampled requests only pay for one random draw.
+"""
+
+import functools
+import inspect
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+
+
+# W3C trace context: version-traceid-parentid-flags, lowercase hex
+TRACEPARENT = re.compile(r"[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+
+_current_span = ContextVar("current_span", default=None)
+_request_phases = ContextVar("request_phases", default=None)
+
+tracer = None
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace, name, parent_id, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def child(self, name, attributes=None):
+        return Span(self.trace, name, self.span_id, attributes)
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = str(error) or type(error).__name__
+        self.trace.spans.append(self)
+
+    def to_dict(self):
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"}
+        }
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+
+
+class ConsoleSpanExporter:
+    def export(self, spans):
+        sys.stdout.write("".join(json.dumps(span, default=str) + "\n" for span in spans))
+        sys.stdout.flush()
+
+
+class FileSpanExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = "".join(json.dumps(span, default=str) + "\n" for span in spans)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+
+
+class Tracer:
+    def __init__(self, exporter, sample_rate, max_queued=10000):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = None
+
+    def start(self):
+        # Per worker: the export thread would not survive gunicorn's fork
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._export_queued, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Export the traces still queued and stop the export thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def start_trace(self, name, traceparent=None, attributes=None):
+        """Return the root span of a new trace, or None when the request is not sampled."""
+        parent_id = None
+        match = TRACEPARENT.fullmatch(traceparent) if traceparent else None
+        # All-zero IDs are invalid; a malformed header is treated as absent
+        if match and match[1] != "0" * 32 and match[2] != "0" * 16:
+            if not int(match[3], 16) & 1:
+                return None
+            trace_id, parent_id = match[1], match[2]
+        else:
+            if random.random() >= self.sample_rate:
+                return None
+            trace_id = "%032x" % random.getrandbits(128)
+        return Span(Trace(trace_id), name, parent_id, attributes)
+
+    def finish_trace(self, root):
+        root.end()
+        try:
+            self._queue.put_nowait((root.trace.trace_id, list(root.trace.spans)))
+        except queue.Full:
+            self.dropped += 1
+
+    def _export_queued(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            trace_id, spans = item
+            try:
+                self.exporter.export([span.to_dict() for span in spans])
+            except Exception as e:
+                logging.error("Error exporting trace %s: %s", trace_id, e)
+
+
+def configure(exporter, sample_rate):
+    global tracer
+    tracer = Tracer(exporter, sample_rate)
+    return tracer
+
+
+def _end_phase(phases, name, error=None):
+    span = phases.pop(name, None)
+    if span is not None:
+        span.end(error)
+
+
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or tracer is None:
+            return await self.app(scope, receive, send)
+
+        traceparent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        root = tracer.start_trace(
+            f'{scope["method"]} {scope["path"]}', traceparent,
+            {"http.method": scope["method"], "http.target": scope["path"]}
+        )
+        if root is None:
+            return await self.app(scope, receive, send)
+
+        phases = {"routing": root.child("routing")}
+        span_token = _current_span.set(root)
+        phases_token = _request_phases.set(phases)
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, traced_send)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            for name in list(phases):
+                _end_phase(phases, name, error)
+            route = scope.get("route")
+            if route is not None:
+                root.name = f'{scope["method"]} {route.path}'
+                root.attributes["http.route"] = route.path
+            if error is not None:
+                root.error = str(error) or type(error).__name__
+            _request_phases.reset(phases_token)
+            _current_span.reset(span_token)
+            tracer.finish_trace(root)
+
+
+def _trace_endpoint(endpoint):
+    @functools.wraps(endpoint)
+    async def traced_endpoint(*args, **kwargs):
+        phases = _request_phases.get()
+        if phases is None:
+            return await endpoint(*args, **kwargs)
+
+        _end_phase(phases, "validate request")
+        handler = _current_span.get().child("handler")
+        token = _current_span.set(handler)
+        try:
+            result = await endpoint(*args, **kwargs)
+        except Exception as e:
+            handler.end(e)
+            raise
+        finally:
+            _current_span.reset(token)
+        handler.end()
+        phases["encode response"] = _current_span.get().child("encode response")
+        return result
+
+    traced_endpoint.is_traced = True
+    return traced_endpoint
+
+
+class TracedRoute(APIRoute):
+    """APIRoute that splits a sampled request into validation, handler and encoding spans."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        # include_router() rebuilds routes from already wrapped endpoints
+        if inspect.iscoroutinefunction(endpoint) and not getattr(endpoint, "is_traced", False):
+            endpoint = _trace_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        route_handler = super().get_route_handler()
+
+        async def traced_route_handler(request):
+            phases = _request_phases.get()
+            if phases is None:
+                return await route_handler(request)
+
+            _end_phase(phases, "routing")
+            phases["validate request"] = _current_span.get().child("validate request")
+            try:
+                response = await route_handler(request)
+            except Exception as e:
+                _end_phase(phases, "validate request", e)
+                _end_phase(phases, "encode response", e)
+                raise
+            _end_phase(phases, "encode response")
+            return response
+
+        return traced_route_handler
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """Records each driver command as a span under the span that issued it.
+
+    Motor runs commands on its executor with a copy of the caller's context,
+    so the current span is visible from the driver thread.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        parent = _current_span.get()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        self._pending[(event.connection_id, event.request_id)] = parent.child(
+            f"mongo {event.command_name}",
+            {
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.mongodb.collection": collection if isinstance(collection, str) else None
+            }
+        )
+
+    def succeeded(self, event):
+        span = self._pending.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.end()
+
+    def failed(self, event):
+        span = self._pending.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.end(event.failure.get("errmsg") or "command failed")
@@ -6,12 +6,16 @@ Tests all backend endpoints based on test_result.md requirements
 
 import requests
 import json
+import os
 import sys
 from datetime import datetime
 import uuid
 
-# Get backend URL from frontend .env file
-BACKEND_URL = "https://e1b71791-a79a-4d70-b795-1c3b56418d1e.preview.emergentagent.com/api"
+# Get backend URL from frontend .env file; point BACKEND_URL at a local
+# server started with MONGO_URL=memory:// to run without MongoDB
+BACKEND_URL = os.environ.get(
+    "BACKEND_URL", "https://e1b71791-a79a-4d70-b795-1c3b56418d1e.preview.emergentagent.com/api"
+)
 
 class BackendTester:
     def __init__(self):
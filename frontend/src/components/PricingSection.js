@@ -1,7 +1,6 @@
 import React, { useState, useEffect } from "react";
 import { Check, Star, Crown, Zap } from "lucide-react";
-
-const API_URL = process.env.REACT_APP_BACKEND_URL;
+import { fetchCatalog } from "../lib/catalog";
 
 const PricingSection = () => {
   const [plans, setPlans] = useState([]);
@@ -13,8 +12,7 @@ const PricingSection = () => {
     const fetchPlans = async () => {
       try {
         setLoading(true);
-        const response = await fetch(`${API_URL}/api/plans`);
-        const data = await response.json();
+        const data = await fetchCatalog("plans");
         
         if (data.success) {
           setPlans(data.data);
@@ -1,7 +1,6 @@
 import React, { useState, useEffect } from "react";
 import { Star, Quote } from "lucide-react";
-
-const API_URL = process.env.REACT_APP_BACKEND_URL;
+import { fetchCatalog } from "../lib/catalog";
 
 const TestimonialsSection = () => {
   const [testimonials, setTestimonials] = useState([]);
@@ -13,8 +12,7 @@ const TestimonialsSection = () => {
     const fetchTestimonials = async () => {
       try {
         setLoading(true);
-        const response = await fetch(`${API_URL}/api/testimonials`);
-        const data = await response.json();
+        const data = await fetchCatalog("testimonials");
         
         if (data.success) {
           setTestimonials(data.data);
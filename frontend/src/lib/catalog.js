@@ -0,0 +1,45 @@
+const API_URL = process.env.REACT_APP_BACKEND_URL;
+// Where the backend's STATIC_EXPORT_DIR is served (a CDN or static host);
+// without it the catalog always comes from the API
+const CATALOG_URL = process.env.REACT_APP_CATALOG_URL;
+
+let manifestRequest = null;
+
+const fetchManifest = () => {
+  if (!manifestRequest) {
+    // Revalidated on every page load; the files it points to never change
+    manifestRequest = fetch(`${CATALOG_URL}/manifest.json`, { cache: "no-cache" })
+      .then((response) => {
+        if (!response.ok) {
+          throw new Error(`manifest returned ${response.status}`);
+        }
+        return response.json();
+      })
+      .catch((err) => {
+        manifestRequest = null;
+        throw err;
+      });
+  }
+  return manifestRequest;
+};
+
+// Fetch "plans" or "testimonials": the published static file when there is
+// one, otherwise the API. Both return the same { success, data } body.
+export const fetchCatalog = async (name) => {
+  if (CATALOG_URL) {
+    try {
+      const manifest = await fetchManifest();
+      const file = manifest.files[name];
+      if (file) {
+        const response = await fetch(`${CATALOG_URL}/${file}`);
+        if (response.ok) {
+          return await response.json();
+        }
+      }
+    } catch (err) {
+      console.warn(`Static ${name} unavailable, falling back to the API:`, err);
+    }
+  }
+  const response = await fetch(`${API_URL}/api/${name}`);
+  return response.json();
+};
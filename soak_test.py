@@ -0,0 +1,634 @@
+#!/usr/bin/env python3
+"""
+Soak and chaos test for the order pipeline
+Starts a local stack (gunicorn workers behind a fault-injecting MongoDB
+proxy), drives create -> confirm -> download for a fixed duration while
+slowing Mongo down, dropping its connections and killing workers, then
+reports memory/latency drift and checks the data the run left behind.
+
+Needs a MongoDB server (a scratch database is created and dropped) and
+Linux, for /proc. Example:
+
+    python soak_test.py --duration 3600 --clients 16 --workers 4
+"""
+
+import argparse
+import json
+import os
+import random
+import select
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+from urllib.parse import quote_plus
+
+import requests
+from pymongo import MongoClient
+from pymongo.uri_parser import parse_uri
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / "backend"
+ADMIN_KEY = "soak-admin-key"
+FAULTS = ("slow-mongo", "drop-connections", "kill-worker", "reload")
+# Latency samples kept per (minute, operation)
+SAMPLES_PER_BUCKET = 2000
+
+
+class FaultProxy:
+    """TCP proxy in front of MongoDB that can add latency or cut every connection."""
+
+    def __init__(self, target):
+        self.target = target
+        self.latency = 0.0
+        self._server = socket.create_server(("127.0.0.1", 0))
+        self.port = self._server.getsockname()[1]
+        self._connections = set()
+        self._lock = threading.Lock()
+        self._running = True
+
+    def start(self):
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def stop(self):
+        self._running = False
+        self._server.close()
+        self.drop_connections()
+
+    def drop_connections(self):
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for sock in connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        return len(connections) // 2
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                client, _ = self._server.accept()
+                upstream = socket.create_connection(self.target, timeout=5)
+            except OSError:
+                continue
+            with self._lock:
+                self._connections.update((client, upstream))
+            threading.Thread(target=self._pipe, args=(client, upstream), daemon=True).start()
+
+    def _pipe(self, client, upstream):
+        peers = {client: upstream, upstream: client}
+        try:
+            while True:
+                readable, _, _ = select.select(list(peers), [], [], 1.0)
+                for sock in readable:
+                    data = sock.recv(65536)
+                    if not data:
+                        return
+                    if sock is client and self.latency:
+                        # Delays every command on this connection
+                        time.sleep(self.latency)
+                    peers[sock].sendall(data)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(client)
+                self._connections.discard(upstream)
+            client.close()
+            upstream.close()
+
+
+class Stack:
+    """The API under gunicorn, configured for one soak run."""
+
+    def __init__(self, mongo_url, db_name, run_dir, port, workers, write_behind):
+        self.port = port
+        self.workers = workers
+        self.run_dir = run_dir
+        self.env = dict(
+            os.environ,
+            BIND=f"127.0.0.1:{port}",
+            MONGO_URL=mongo_url,
+            DB_NAME=db_name,
+            DATA_DIR=str(run_dir / "data"),
+            FILES_DIR=str(run_dir / "files"),
+            ORDER_WRITE_BEHIND="1" if write_behind else "0",
+            ADMIN_API_KEY=ADMIN_KEY,
+            MONGO_SERVER_SELECTION_TIMEOUT_MS="2000",
+            LOG_FORMAT="json",
+        )
+        self.process = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/api"
+
+    def start(self, workers=None):
+        env = dict(self.env, WEB_CONCURRENCY=str(workers or self.workers))
+        log = open(self.run_dir / "server.log", "a")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "server:app"],
+            cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server exited with {self.process.returncode}, see {self.run_dir / 'server.log'}")
+            try:
+                if requests.get(f"{self.base_url}/", timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        raise RuntimeError("server did not become healthy within 60s")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            # Graceful: workers replay their order logs and flush counters
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def worker_pids(self):
+        try:
+            children = Path(f"/proc/{self.process.pid}/task/{self.process.pid}/children").read_text()
+        except OSError:
+            return []
+        return [int(pid) for pid in children.split()]
+
+    def pending_order_logs(self):
+        log_dir = self.run_dir / "data" / "order_log"
+        if not log_dir.is_dir():
+            return []
+        return [path for path in log_dir.iterdir() if path.suffix in (".log", ".flushing") and path.stat().st_size]
+
+
+def read_proc(pid):
+    """RSS in MB and open file descriptors of a process, or None when it is gone."""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+        fds = len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return None
+    rss_kb = next(int(line.split()[1]) for line in status.splitlines() if line.startswith("VmRSS:"))
+    return rss_kb / 1024, fds
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class SoakTester:
+    def __init__(self, args):
+        self.args = args
+        self.started = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+        # Latency samples by (minute, operation), errors by (operation, kind)
+        self.latencies = defaultdict(list)
+        self.latency_counts = Counter()
+        self.errors = Counter()
+        self.resources = []
+        self.faults = []
+
+        # What clients were told, checked against the database at the end
+        self.created = {}
+        self.failed_creates = 0
+        self.confirmed = set()
+        self.link_sets = defaultdict(set)
+        self.downloads = Counter()
+        self.bad_downloads = 0
+        self.plans = []
+        self.file_sizes = {}
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    # Load
+
+    def record_latency(self, op, seconds):
+        key = (int(self.elapsed() // 60), op)
+        with self.lock:
+            self.latency_counts[key] += 1
+            bucket = self.latencies[key]
+            if len(bucket) < SAMPLES_PER_BUCKET:
+                bucket.append(seconds)
+            else:
+                # Reservoir sampling keeps the bucket representative
+                slot = random.randrange(self.latency_counts[key])
+                if slot < SAMPLES_PER_BUCKET:
+                    bucket[slot] = seconds
+
+    def call(self, session, op, method, url, retry_statuses=(500, 502, 503, 504), **kwargs):
+        """One API call with retries, the way an impatient client behaves."""
+        for attempt in range(self.args.retries + 1):
+            if attempt:
+                time.sleep(min(2.0, 0.1 * 2 ** attempt))
+            started = time.monotonic()
+            try:
+                response = session.request(method, url, timeout=self.args.timeout, **kwargs)
+                body = response.content
+            except requests.RequestException as e:
+                with self.lock:
+                    self.errors[(op, type(e).__name__)] += 1
+                continue
+            self.record_latency(op, time.monotonic() - started)
+            if response.status_code in retry_statuses:
+                with self.lock:
+                    self.errors[(op, str(response.status_code))] += 1
+                continue
+            return response, body
+        return None, None
+
+    def run_lifecycle(self, session, base_url):
+        nonce = uuid.uuid4().hex
+        plan = random.choice(self.plans)
+        email = f"soak-{random.randrange(self.args.customers)}@example.com"
+        response, _ = self.call(session, "create_order", "POST", f"{base_url}/orders", json={
+            "planId": plan["id"], "customerEmail": email, "customerName": "Soak Test", "notes": f"soak:{nonce}"
+        })
+        if response is None or response.status_code != 200:
+            with self.lock:
+                self.failed_creates += 1
+            return
+        order_id = response.json()["data"]["orderId"]
+        with self.lock:
+            self.created[order_id] = nonce
+
+        # In write-behind mode another worker may not see the order until its log is replayed
+        self.call(session, "get_order", "GET", f"{base_url}/orders/{order_id}", retry_statuses=(404, 500, 502, 503, 504))
+
+        confirmations = 2 if random.random() < self.args.reconfirm_rate else 1
+        links = []
+        for _ in range(confirmations):
+            response, _ = self.call(
+                session, "confirm_order", "PUT", f"{base_url}/orders/{order_id}/confirm",
+                retry_statuses=(404, 500, 502, 503, 504), headers={"X-Admin-Key": ADMIN_KEY}
+            )
+            if response is None or response.status_code != 200:
+                return
+            links = response.json()["data"]["downloadLinks"]
+            with self.lock:
+                self.confirmed.add(order_id)
+                self.link_sets[order_id].add(tuple(links))
+
+        for link in links:
+            response, body = self.call(session, "download", "GET", f"http://127.0.0.1:{self.args.port}{link}")
+            if response is None or response.status_code != 200:
+                continue
+            expected = self.file_sizes.get(response.headers.get("content-disposition", "").split("filename=")[-1].strip('"'))
+            with self.lock:
+                self.downloads[order_id] += 1
+                if expected is not None and len(body) != expected:
+                    self.bad_downloads += 1
+
+    def client_loop(self, base_url):
+        session = requests.Session()
+        while not self.stop_event.is_set():
+            try:
+                self.run_lifecycle(session, base_url)
+            except Exception as e:
+                with self.lock:
+                    self.errors[("client", type(e).__name__)] += 1
+            if self.args.think_time:
+                time.sleep(random.uniform(0, self.args.think_time))
+
+    # Faults and monitoring
+
+    def chaos_loop(self, stack, proxy):
+        faults = [fault for fault in self.args.faults if fault]
+        while faults and not self.stop_event.wait(random.uniform(0.5, 1.5) * self.args.fault_interval):
+            fault = random.choice(faults)
+            detail = None
+            if fault == "slow-mongo":
+                proxy.latency = random.uniform(0.1, 1.0)
+                detail = f"{proxy.latency * 1000:.0f} ms for 20 s"
+                self.stop_event.wait(20)
+                proxy.latency = 0.0
+            elif fault == "drop-connections":
+                detail = f"{proxy.drop_connections()} connections"
+            elif fault == "kill-worker":
+                pids = stack.worker_pids()
+                if pids:
+                    pid = random.choice(pids)
+                    os.kill(pid, signal.SIGKILL)
+                    detail = f"pid {pid}"
+            elif fault == "reload":
+                os.kill(stack.process.pid, signal.SIGHUP)
+            with self.lock:
+                self.faults.append({"at": round(self.elapsed(), 1), "fault": fault, "detail": detail})
+            print(f"   ⚡ {self.elapsed():7.0f}s {fault} {detail or ''}")
+
+    def monitor_loop(self, stack, admin_db):
+        while not self.stop_event.wait(self.args.sample_interval):
+            workers = [read_proc(pid) for pid in stack.worker_pids()]
+            workers = [sample for sample in workers if sample is not None]
+            try:
+                mongo_connections = admin_db.command("serverStatus")["connections"]["current"]
+            except Exception:
+                mongo_connections = None
+            if workers:
+                self.resources.append({
+                    "at": round(self.elapsed(), 1),
+                    "workers": len(workers),
+                    "rssPerWorkerMb": round(sum(rss for rss, _ in workers) / len(workers), 1),
+                    "maxRssMb": round(max(rss for rss, _ in workers), 1),
+                    "fdsPerWorker": round(sum(fds for _, fds in workers) / len(workers), 1),
+                    "mongoConnections": mongo_connections,
+                })
+
+    # Reporting
+
+    def window(self, first):
+        """Minutes in the first or last fifth of the run, skipping the first minute of warm-up."""
+        minutes = sorted({minute for minute, _ in self.latencies})
+        if len(minutes) > 2:
+            minutes = minutes[1:]
+        size = max(1, len(minutes) // 5)
+        return set(minutes[:size] if first else minutes[-size:])
+
+    def latency_drift(self):
+        first, last = self.window(True), self.window(False)
+        report = {}
+        for op in sorted({op for _, op in self.latencies}):
+            early = [s for (minute, o), samples in self.latencies.items() if o == op and minute in first for s in samples]
+            late = [s for (minute, o), samples in self.latencies.items() if o == op and minute in last for s in samples]
+            total = sum(count for (_, o), count in self.latency_counts.items() if o == op)
+            report[op] = {
+                "requests": total,
+                "firstP50Ms": round(percentile(early, 0.5) * 1000, 1) if early else None,
+                "firstP99Ms": round(percentile(early, 0.99) * 1000, 1) if early else None,
+                "lastP50Ms": round(percentile(late, 0.5) * 1000, 1) if late else None,
+                "lastP99Ms": round(percentile(late, 0.99) * 1000, 1) if late else None,
+            }
+        return report
+
+    def resource_drift(self):
+        if len(self.resources) < 4:
+            return None
+        size = max(1, len(self.resources) // 5)
+        early, late = self.resources[1:size + 1], self.resources[-size:]
+
+        def mean(samples, key):
+            values = [sample[key] for sample in samples if sample[key] is not None]
+            return round(statistics.mean(values), 1) if values else None
+
+        hours = max((late[-1]["at"] - early[0]["at"]) / 3600, 1 / 60)
+        first_rss, last_rss = mean(early, "rssPerWorkerMb"), mean(late, "rssPerWorkerMb")
+        return {
+            "rssPerWorkerMb": [first_rss, last_rss],
+            "rssGrowthMbPerHour": round((last_rss - first_rss) / hours, 1),
+            "maxRssMb": max(sample["maxRssMb"] for sample in self.resources),
+            "fdsPerWorker": [mean(early, "fdsPerWorker"), mean(late, "fdsPerWorker")],
+            "mongoConnections": [mean(early, "mongoConnections"), mean(late, "mongoConnections")],
+            "maxMongoConnections": max((s["mongoConnections"] or 0) for s in self.resources),
+        }
+
+    def check_integrity(self, db):
+        failures = []
+        warnings = []
+        plans = {plan["id"]: plan for plan in self.plans}
+        orders = list(db.orders.find({}, {"orderId": 1, "notes": 1, "planId": 1, "customerEmail": 1,
+                                          "paymentStatus": 1, "downloadLinks": 1, "downloadCount": 1,
+                                          "maxDownloads": 1}))
+        by_id = {order["orderId"]: order for order in orders}
+
+        lost = [order_id for order_id in self.created if order_id not in by_id]
+        if lost:
+            failures.append(f"{len(lost)} acknowledged orders missing from MongoDB, e.g. {lost[:3]}")
+
+        per_nonce = Counter(order.get("notes") for order in orders)
+        duplicates = sum(count - 1 for count in per_nonce.values() if count > 1)
+
+        confirmed_in_db = Counter()
+        for order in orders:
+            if order.get("paymentStatus") != "confirmed":
+                continue
+            confirmed_in_db[order["customerEmail"]] += 1
+            links = order.get("downloadLinks", [])
+            expected = len(plans.get(order["planId"], {}).get("downloadFiles", []))
+            if len(links) != expected or len(set(links)) != len(links):
+                failures.append(f"{order['orderId']} has {len(links)} links, expected {expected} distinct")
+            seen = self.link_sets.get(order["orderId"], set())
+            if seen - {tuple(links)}:
+                failures.append(f"{order['orderId']} handed out {len(seen)} different link sets")
+            if order.get("downloadCount", 0) > order.get("maxDownloads", 5):
+                failures.append(f"{order['orderId']} downloaded {order['downloadCount']} times, over its limit")
+            if order.get("downloadCount", 0) < self.downloads.get(order["orderId"], 0):
+                failures.append(f"{order['orderId']} served more downloads than it counted")
+
+        unconfirmed = [order_id for order_id in self.confirmed if by_id.get(order_id, {}).get("paymentStatus") != "confirmed"]
+        if unconfirmed:
+            failures.append(f"{len(unconfirmed)} orders confirmed to clients but not in MongoDB, e.g. {unconfirmed[:3]}")
+        if self.bad_downloads:
+            failures.append(f"{self.bad_downloads} downloads returned a truncated or oversized file")
+
+        summaries = {summary["_id"]: summary.get("confirmedOrders", 0) for summary in db.customer_summaries.find({})}
+        for email in set(summaries) | set(confirmed_in_db):
+            if summaries.get(email, 0) != confirmed_in_db.get(email, 0):
+                failures.append(
+                    f"summary for {email} counts {summaries.get(email, 0)} confirmed orders, "
+                    f"MongoDB has {confirmed_in_db.get(email, 0)}"
+                )
+
+        # Counters buffered in a killed worker are lost by design (backfill_stats.py repairs them)
+        stats = list(db.daily_stats.find({}))
+        counted_created = sum(bucket.get("ordersCreated", 0) for bucket in stats)
+        counted_confirmed = sum(bucket.get("ordersConfirmed", 0) for bucket in stats)
+        if counted_created != len(orders) or counted_confirmed != sum(confirmed_in_db.values()):
+            warnings.append(
+                f"sales counters show {counted_created} created / {counted_confirmed} confirmed, "
+                f"MongoDB has {len(orders)} / {sum(confirmed_in_db.values())}"
+            )
+
+        return {
+            "ordersAcknowledged": len(self.created),
+            "ordersInMongo": len(orders),
+            "failedCreates": self.failed_creates,
+            "duplicateOrders": duplicates,
+            "duplicateOrderRate": round(duplicates / len(self.created), 5) if self.created else 0,
+            "confirmed": len(self.confirmed),
+            "downloads": sum(self.downloads.values()),
+            "failures": failures,
+            "warnings": warnings,
+        }
+
+    # Run
+
+    def prepare(self, db, files_dir):
+        self.plans = []
+        for plan in db.plans.find({"isActive": True}):
+            plan["id"] = str(plan.pop("_id"))
+            self.plans.append(plan)
+            for file_path in plan.get("downloadFiles", []):
+                name = Path(file_path).name
+                if name not in self.file_sizes:
+                    data = os.urandom(random.randint(16, 256) * 1024)
+                    (files_dir / name).write_bytes(data)
+                    self.file_sizes[name] = len(data)
+
+    def run(self):
+        args = self.args
+        nodes = parse_uri(args.mongo_url)["nodelist"]
+        if len(nodes) != 1:
+            raise SystemExit("❌ Point --mongo-url at a single mongod; the fault proxy fronts one server")
+        parsed = parse_uri(args.mongo_url)
+        credentials = ""
+        if parsed["username"]:
+            credentials = f"{quote_plus(parsed['username'])}:{quote_plus(parsed['password'] or '')}@"
+        db_name = f"soak_{int(time.time())}"
+        run_dir = Path(tempfile.mkdtemp(prefix="soak-"))
+        (run_dir / "files").mkdir()
+        print(f"🚀 Soak run {db_name}: {args.duration}s, {args.clients} clients, {args.workers} workers")
+        print(f"   Logs and report in {run_dir}")
+
+        direct = MongoClient(args.mongo_url, serverSelectionTimeoutMS=5000)
+        proxy = FaultProxy(nodes[0])
+        proxy.start()
+        # directConnection keeps the driver on the proxy instead of discovering the real address
+        proxied_url = f"mongodb://{credentials}127.0.0.1:{proxy.port}/?directConnection=true"
+        if parsed["options"].get("authsource"):
+            proxied_url += f"&authSource={parsed['options']['authsource']}"
+        stack = Stack(proxied_url, db_name, run_dir, args.port, args.workers, args.write_behind)
+
+        try:
+            subprocess.run(
+                [sys.executable, "init_db.py"], cwd=BACKEND_DIR, check=True, capture_output=True,
+                env=dict(stack.env, MONGO_URL=args.mongo_url)
+            )
+            self.prepare(direct[db_name], run_dir / "files")
+            stack.start()
+
+            self.started = time.monotonic()
+            threads = [threading.Thread(target=self.client_loop, args=(stack.base_url,), daemon=True)
+                       for _ in range(args.clients)]
+            threads.append(threading.Thread(target=self.chaos_loop, args=(stack, proxy), daemon=True))
+            threads.append(threading.Thread(target=self.monitor_loop, args=(stack, direct.admin), daemon=True))
+            for thread in threads:
+                thread.start()
+
+            while self.elapsed() < args.duration:
+                time.sleep(min(args.progress_interval, max(0.1, args.duration - self.elapsed())))
+                with self.lock:
+                    errors = sum(self.errors.values())
+                print(f"   {self.elapsed():7.0f}s  {len(self.created)} orders, {len(self.confirmed)} confirmed, "
+                      f"{sum(self.downloads.values())} downloads, {errors} errors")
+
+            self.stop_event.set()
+            proxy.latency = 0.0
+            for thread in threads:
+                thread.join(timeout=args.timeout * (args.retries + 2) + 30)
+            stack.stop()
+
+            # Logs left by killed workers are replayed by whichever worker adopts them
+            if stack.pending_order_logs():
+                print("   Replaying order logs left by killed workers...")
+                stack.start(workers=1)
+                deadline = time.monotonic() + 60
+                while stack.pending_order_logs() and time.monotonic() < deadline:
+                    time.sleep(1)
+                stack.stop()
+
+            report = {
+                "database": db_name,
+                "durationS": args.duration,
+                "latency": self.latency_drift(),
+                "resources": self.resource_drift(),
+                "errors": {f"{op} {kind}": count for (op, kind), count in sorted(self.errors.items())},
+                "faults": self.faults,
+                "integrity": self.check_integrity(direct[db_name]),
+            }
+        finally:
+            self.stop_event.set()
+            stack.stop()
+            proxy.stop()
+            if not args.keep_db:
+                direct.drop_database(db_name)
+            direct.close()
+
+        (run_dir / "report.json").write_text(json.dumps(report, indent=2))
+        return self.print_report(report, run_dir)
+
+    def print_report(self, report, run_dir):
+        print("\n📈 Latency, first vs last fifth of the run (p50 / p99 ms)")
+        for op, row in report["latency"].items():
+            print(f"   {op:<14} {row['requests']:>8} requests   "
+                  f"{row['firstP50Ms']} / {row['firstP99Ms']}  ->  {row['lastP50Ms']} / {row['lastP99Ms']}")
+
+        resources = report["resources"]
+        if resources:
+            print("\n🧠 Resources, first vs last fifth of the run")
+            print(f"   RSS per worker   {resources['rssPerWorkerMb'][0]} -> {resources['rssPerWorkerMb'][1]} MB "
+                  f"({resources['rssGrowthMbPerHour']:+} MB/h, max {resources['maxRssMb']} MB)")
+            print(f"   FDs per worker   {resources['fdsPerWorker'][0]} -> {resources['fdsPerWorker'][1]}")
+            print(f"   Mongo conns      {resources['mongoConnections'][0]} -> {resources['mongoConnections'][1]} "
+                  f"(max {resources['maxMongoConnections']})")
+
+        if report["errors"]:
+            print("\n⚠️  Client-visible errors (before retries succeeded or gave up)")
+            for name, count in report["errors"].items():
+                print(f"   {name:<32} {count}")
+
+        integrity = report["integrity"]
+        print("\n🔍 Integrity")
+        print(f"   {integrity['ordersAcknowledged']} orders acknowledged, {integrity['ordersInMongo']} in MongoDB, "
+              f"{integrity['failedCreates']} creates gave up")
+        print(f"   {integrity['duplicateOrders']} duplicate orders from client retries "
+              f"({integrity['duplicateOrderRate'] * 100:.3f}%)")
+        print(f"   {integrity['confirmed']} confirmed, {integrity['downloads']} downloads")
+        for warning in integrity["warnings"]:
+            print(f"   ⚠️  {warning}")
+        for failure in integrity["failures"][:20]:
+            print(f"   ❌ {failure}")
+
+        print(f"\nReport written to {run_dir / 'report.json'}")
+        if integrity["failures"]:
+            print(f"❌ {len(integrity['failures'])} integrity checks failed")
+            return 1
+        print("✅ All integrity checks passed")
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak and chaos test for the order pipeline")
+    parser.add_argument("--mongo-url", default=os.environ.get("SOAK_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--duration", type=float, default=600, help="seconds of load")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent simulated customers")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--customers", type=int, default=200, help="distinct customer emails")
+    parser.add_argument("--write-behind", action="store_true", help="run with ORDER_WRITE_BEHIND=1")
+    parser.add_argument("--faults", type=lambda value: [f for f in value.split(",") if f], default=list(FAULTS),
+                        help=f"comma-separated subset of {','.join(FAULTS)}; empty for none")
+    parser.add_argument("--fault-interval", type=float, default=60, help="mean seconds between faults")
+    parser.add_argument("--reconfirm-rate", type=float, default=0.2, help="share of orders confirmed twice")
+    parser.add_argument("--think-time", type=float, default=0.0, help="max pause between a client's orders")
+    parser.add_argument("--timeout", type=float, default=10, help="client request timeout")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--sample-interval", type=float, default=5, help="seconds between resource samples")
+    parser.add_argument("--progress-interval", type=float, default=30)
+    parser.add_argument("--keep-db", action="store_true", help="keep the soak database for inspection")
+    args = parser.parse_args()
+    unknown = set(args.faults) - set(FAULTS)
+    if unknown:
+        parser.error(f"unknown faults: {', '.join(sorted(unknown))}")
+    sys.exit(SoakTester(args).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+ADMIN_KEY = "test-admin-key"
+MAGIC_LINK_SECRET = "test-magic-link-secret-0123456789abcdef"
+
+
+@pytest.fixture
+def app_env(tmp_path, monkeypatch):
+    """Settings for an API that keeps everything in this process."""
+    files_dir = tmp_path / "files"
+    files_dir.mkdir()
+    monkeypatch.setenv("MONGO_URL", "memory://")
+    monkeypatch.setenv("DB_NAME", "test")
+    monkeypatch.setenv("DATA_DIR", str(tmp_path / "var"))
+    monkeypatch.setenv("FILES_DIR", str(files_dir))
+    monkeypatch.setenv("ADMIN_API_KEY", ADMIN_KEY)
+    monkeypatch.setenv("MAGIC_LINK_SECRET", MAGIC_LINK_SECRET)
+    monkeypatch.setenv("LOG_FORMAT", "text")
+    monkeypatch.setenv("LOG_LEVEL", "WARNING")
+    return tmp_path
+
+
+@pytest.fixture
+def client(app_env):
+    from fastapi.testclient import TestClient
+
+    import server
+    from init_db import PLANS_DATA
+
+    files_dir = app_env / "files"
+    for plan in PLANS_DATA:
+        for file_path in plan["downloadFiles"]:
+            (files_dir / Path(file_path).name).write_bytes(b"%PDF-1.4 " + file_path.encode() * 100)
+
+    with TestClient(server.create_app()) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def admin_headers():
+    return {"X-Admin-Key": ADMIN_KEY}
@@ -0,0 +1,28 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from analytics import SalesCounters, bucket_day, bucket_id
+from resilience import CircuitBreaker
+from storage import create_client
+
+
+def test_confirmations_count_on_the_day_they_happen():
+    now = datetime.utcnow()
+    yesterday = now - timedelta(days=1)
+    order = {"planId": "p1", "planName": "Basic Plan", "currency": "$", "amount": 2.0, "createdAt": yesterday}
+
+    async def run():
+        stats = create_client("memory://")["test"]["daily_stats"]
+        counters = SalesCounters(stats)
+        counters.start(CircuitBreaker())
+        counters.order_created(order)
+        counters.order_confirmed(order, now)
+        await counters.close()
+        return {bucket["_id"]: bucket for bucket in await stats.find({}).to_list(length=None)}
+
+    buckets = asyncio.run(run())
+    created = buckets[bucket_id(bucket_day(yesterday), "p1")]
+    confirmed = buckets[bucket_id(bucket_day(now), "p1")]
+    assert (created["ordersCreated"], created.get("ordersConfirmed", 0)) == (1, 0)
+    assert (confirmed.get("ordersCreated", 0), confirmed["ordersConfirmed"]) == (0, 1)
+    assert confirmed["revenue"] == {"USD": 2.0}
@@ -0,0 +1,205 @@
+from init_db import PLANS_DATA, TESTIMONIALS_DATA
+
+
+def create_order(client, plan_id, **fields):
+    body = {"planId": plan_id, "customerEmail": "Reader@Example.com", "customerName": "Reader", **fields}
+    return client.post("/api/orders", json=body)
+
+
+def test_get_plans(client):
+    response = client.get("/api/plans")
+    assert response.status_code == 200
+    plans = response.json()["data"]
+    assert [plan["name"] for plan in plans] == [plan["name"] for plan in PLANS_DATA]
+    assert all(len(plan["id"]) == 24 for plan in plans)
+
+
+def test_get_plan(client):
+    plan = client.get("/api/plans").json()["data"][0]
+    assert client.get(f"/api/plans/{plan['id']}").json()["data"]["name"] == plan["name"]
+    assert client.get("/api/plans/" + "0" * 24).status_code == 404
+    assert client.get("/api/plans/not-an-id").status_code == 404
+    assert client.get(f"/api/plans/{plan['id'].upper()}").json()["data"]["id"] == plan["id"]
+
+
+def test_get_plans_in_other_currency(client):
+    plans = client.get("/api/plans", params={"region": "IN"}).json()["data"]
+    assert {plan["currencyCode"] for plan in plans} == {"INR"}
+    assert client.get("/api/plans", params={"currency": "XYZ"}).status_code == 422
+
+
+def test_get_testimonials(client):
+    testimonials = client.get("/api/testimonials").json()["data"]
+    assert len(testimonials) == sum(1 for testimonial in TESTIMONIALS_DATA if testimonial["isApproved"])
+
+
+def test_order_lifecycle(client, admin_headers):
+    plan = client.get("/api/plans").json()["data"][1]
+    created = create_order(client, plan["id"])
+    assert created.status_code == 200
+    order_id = created.json()["data"]["orderId"]
+    assert created.json()["data"]["amount"] == plan["price"]
+
+    order = client.get(f"/api/orders/{order_id}").json()["data"]
+    assert order["paymentStatus"] == "pending"
+    # Only an admin who has seen the payment can confirm
+    assert client.put(f"/api/orders/{order_id}/confirm").status_code == 403
+    assert order["customerEmail"] == "reader@example.com"
+
+    links = client.put(f"/api/orders/{order_id}/confirm", headers=admin_headers).json()["data"]["downloadLinks"]
+    assert len(links) == len(plan["downloadFiles"])
+    # Confirming again hands out the same links
+    assert client.put(f"/api/orders/{order_id}/confirm", headers=admin_headers).json()["data"]["downloadLinks"] == links
+
+    download = client.get(links[0], headers={"Accept-Encoding": "gzip"})
+    assert download.status_code == 200
+    assert download.content.startswith(b"%PDF")
+    # Sent as stored, not gzipped on the fly
+    assert "content-encoding" not in download.headers
+    assert int(download.headers["content-length"]) == len(download.content)
+    assert client.get(f"/api/orders/{order_id}").json()["data"]["downloadCount"] == 1
+
+
+def test_order_for_plan_id_in_upper_case(client):
+    plan = client.get("/api/plans").json()["data"][0]
+    order_id = create_order(client, plan["id"].upper()).json()["data"]["orderId"]
+    assert client.get(f"/api/orders/{order_id}").json()["data"]["planId"] == plan["id"]
+
+
+def test_order_for_unknown_plan(client):
+    assert create_order(client, "0" * 24).status_code == 404
+    assert create_order(client, "not-an-id").status_code == 422
+
+
+def test_download_needs_a_valid_link(client, admin_headers):
+    plan = client.get("/api/plans").json()["data"][0]
+    order_id = create_order(client, plan["id"]).json()["data"]["orderId"]
+    # Not confirmed yet
+    assert client.get(f"/api/downloads/{order_id}/some-token").status_code == 404
+    client.put(f"/api/orders/{order_id}/confirm", headers=admin_headers)
+    assert client.get(f"/api/downloads/{order_id}/some-token").status_code == 404
+
+
+def test_coupon_discount(client, admin_headers):
+    plan = client.get("/api/plans").json()["data"][2]
+    coupon = {"code": "launch20", "type": "percent", "value": 20, "maxUses": 1}
+    assert client.post("/api/admin/coupons", json=coupon, headers=admin_headers).status_code == 200
+
+    order = create_order(client, plan["id"], couponCode="LAUNCH20").json()["data"]
+    assert order["amount"] == round(plan["price"] * 0.8, 2)
+    # Used up
+    assert create_order(client, plan["id"], couponCode="LAUNCH20").status_code == 422
+    assert create_order(client, plan["id"], couponCode="NOPE1").status_code == 422
+
+
+def test_coupon_with_a_utc_offset(client, admin_headers):
+    plan = client.get("/api/plans").json()["data"][2]
+    coupons = [
+        {"code": "STARTED", "type": "percent", "value": 10, "startsAt": "2020-01-01T05:30:00+05:30"},
+        {"code": "LATER", "type": "percent", "value": 10, "startsAt": "2999-01-01T00:00:00Z"}
+    ]
+    for coupon in coupons:
+        created = client.post("/api/admin/coupons", json=coupon, headers=admin_headers).json()["data"]
+        assert created["startsAt"] == coupon["startsAt"][:4] + "-01-01T00:00:00"
+    assert create_order(client, plan["id"], couponCode="STARTED").status_code == 200
+    assert create_order(client, plan["id"], couponCode="LATER").json()["detail"] == "Coupon is not active yet"
+
+
+def test_coupon_use_is_given_back_when_the_order_is_not_taken(client, admin_headers, monkeypatch):
+    import server
+
+    async def disk_full(doc):
+        raise OSError("No space left on device")
+
+    plan = client.get("/api/plans").json()["data"][2]
+    coupon = {"code": "ONCE", "type": "percent", "value": 20, "maxUses": 1}
+    client.post("/api/admin/coupons", json=coupon, headers=admin_headers)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(server, "write_behind", True)
+        patch.setattr(server.order_spool, "append", disk_full)
+        assert create_order(client, plan["id"], couponCode="ONCE").status_code == 500
+    assert create_order(client, plan["id"], couponCode="ONCE").status_code == 200
+
+
+def test_order_during_an_outage(client, admin_headers, monkeypatch):
+    import time
+
+    import server
+
+    plan = client.get("/api/plans").json()["data"][2]
+    coupon = {"code": "LIMITED", "type": "percent", "value": 20, "maxUses": 5}
+    client.post("/api/admin/coupons", json=coupon, headers=admin_headers)
+    # Load the coupon index while Mongo is up
+    create_order(client, plan["id"], couponCode="LIMITED")
+
+    monkeypatch.setattr(server.db_breaker, "opened_at", time.monotonic())
+    # Taking a use of a limited coupon needs Mongo
+    assert create_order(client, plan["id"], couponCode="LIMITED").status_code == 503
+    # Anything else goes to the order log
+    assert create_order(client, plan["id"]).status_code == 200
+
+
+def test_admin_endpoints_need_the_key(client, admin_headers):
+    coupon = {"code": "FREE100", "type": "percent", "value": 100}
+    assert client.get("/api/admin/stats").status_code == 403
+    assert client.get("/api/admin/stats", headers={"X-Admin-Key": "wrong"}).status_code == 403
+    assert client.post("/api/admin/coupons", json=coupon).status_code == 403
+    assert client.get("/api/admin/stats", headers=admin_headers).status_code == 200
+
+
+def test_download_audit_is_admin_only(client, admin_headers):
+    plan = client.get("/api/plans").json()["data"][0]
+    order_id = create_order(client, plan["id"]).json()["data"]["orderId"]
+    assert client.get(f"/api/orders/{order_id}/downloads").status_code == 403
+    assert client.get(f"/api/orders/{order_id}/downloads", headers=admin_headers).json()["success"]
+
+
+
+def customer_history(client, admin_headers, email="reader@example.com"):
+    link = client.post(f"/api/admin/customers/{email}/magic-link", headers=admin_headers)
+    return client.get(link.json()["data"]["ordersUrl"]).json()["data"]
+
+
+def test_customer_history(client, admin_headers):
+    plan = client.get("/api/plans").json()["data"][0]
+    order_id = create_order(client, plan["id"]).json()["data"]["orderId"]
+    confirmed = client.put(f"/api/orders/{order_id}/confirm", headers=admin_headers).json()["data"]
+    # The storefront never hands out the link to a customer's history
+    assert "ordersUrl" not in confirmed
+    client.put(f"/api/orders/{order_id}/confirm", headers=admin_headers)
+
+    history = customer_history(client, admin_headers)
+    assert [order["orderId"] for order in history["orders"]] == [order_id]
+    assert history["summary"]["confirmedOrders"] == 1
+    assert history["summary"]["lifetimeSpend"] == {"USD": plan["price"]}
+
+    assert client.post("/api/admin/customers/reader@example.com/magic-link").status_code == 403
+    assert client.get("/api/customers/reader@example.com/orders", params={"token": "forged"}).status_code == 401
+
+
+def test_customer_history_is_disabled_without_a_secret(client, admin_headers, monkeypatch):
+    monkeypatch.delenv("MAGIC_LINK_SECRET")
+    assert client.post("/api/admin/customers/reader@example.com/magic-link", headers=admin_headers).status_code == 404
+    assert client.get("/api/customers/reader@example.com/orders", params={"token": "any"}).status_code == 404
+
+
+def test_confirming_again_catches_up_the_customer_summary(client, admin_headers, monkeypatch):
+    import server
+    from resilience import DatabaseUnavailable
+
+    record_confirmed_order = server.record_confirmed_order
+
+    async def unavailable(summaries, order):
+        raise DatabaseUnavailable("timed out")
+
+    plan = client.get("/api/plans").json()["data"][0]
+    order_id = create_order(client, plan["id"]).json()["data"]["orderId"]
+    monkeypatch.setattr(server, "record_confirmed_order", unavailable)
+    assert client.put(f"/api/orders/{order_id}/confirm", headers=admin_headers).status_code == 503
+    assert customer_history(client, admin_headers)["summary"]["confirmedOrders"] == 0
+
+    monkeypatch.setattr(server, "record_confirmed_order", record_confirmed_order)
+    for _ in range(2):
+        assert client.put(f"/api/orders/{order_id}/confirm", headers=admin_headers).json()["data"]["message"] == "Order already confirmed"
+        assert customer_history(client, admin_headers)["summary"]["confirmedOrders"] == 1
@@ -0,0 +1,45 @@
+import time
+
+import cache
+import server
+
+
+def insert_testimonial(client, name):
+    async def insert():
+        await server.db.testimonials.insert_one({
+            "name": name, "location": "Pune, India", "rating": 5, "text": "Clear and practical.",
+            "planName": "Basic Plan", "isApproved": True, "isActive": True
+        })
+    client.portal.call(insert)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_write_with_version_bump_invalidates(client):
+    before = len(client.get("/api/testimonials").json()["data"])
+    insert_testimonial(client, "Bumped")
+    client.portal.call(cache.bump_cache_version, server.db, "testimonials")
+    wait_for(lambda: len(client.get("/api/testimonials").json()["data"]) == before + 1)
+
+
+def test_direct_edit_is_served_within_max_age(app_env, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    # Read when the app is built, after .env has been loaded
+    monkeypatch.setenv("CATALOG_MAX_AGE", "0.3")
+    with TestClient(server.create_app()) as client:
+        before = len(client.get("/api/testimonials").json()["data"])
+        # No cache_versions bump, as when someone edits Mongo by hand
+        insert_testimonial(client, "Direct")
+        wait_for(lambda: len(client.get("/api/testimonials").json()["data"]) == before + 1)
+
+
+def test_unchanged_reload_keeps_cached_object(client):
+    plans = client.portal.call(server.get_catalog, "plans")
+    server.catalog_cache.invalidate("plans")
+    assert client.portal.call(server.get_catalog, "plans") is plans
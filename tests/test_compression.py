@@ -0,0 +1,34 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.responses import Response
+
+from compression import SelectiveGZipMiddleware
+
+BODY = b"x" * 4096
+
+
+def make_client():
+    app = FastAPI()
+
+    @app.get("/api/report")
+    async def report():
+        return {"data": BODY.decode()}
+
+    @app.get("/api/downloads/book")
+    async def download():
+        return Response(BODY, media_type="application/pdf")
+
+    app.add_middleware(SelectiveGZipMiddleware, exclude_prefixes=("/api/downloads/",), minimum_size=1024)
+    return TestClient(app)
+
+
+def test_excluded_paths_are_not_compressed():
+    client = make_client()
+    compressed = client.get("/api/report", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.json()["data"] == BODY.decode()
+
+    download = client.get("/api/downloads/book", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in download.headers
+    assert download.headers["content-length"] == str(len(BODY))
+    assert download.content == BODY
@@ -0,0 +1,41 @@
+import asyncio
+
+from init_db import TESTIMONIALS_DATA, seed_database
+from storage import create_client
+
+
+def test_reseeding_leaves_submitted_testimonials_alone():
+    async def run():
+        db = create_client("memory://")["test"]
+        await seed_database(db)
+        submitted = {
+            "name": "Priya Sharma",
+            "location": "Pune, India",
+            "rating": 4,
+            "text": "My own words",
+            "planName": "Basic Plan",
+            "isApproved": False,
+            "isActive": True
+        }
+        await db.testimonials.insert_one(dict(submitted))
+        _, diff = await seed_database(db)
+        return diff, await db.testimonials.find({}, {"_id": 0}).to_list(length=None)
+
+    diff, testimonials = asyncio.run(run())
+    assert len(diff["unchanged"]) == len(TESTIMONIALS_DATA)
+    assert len(testimonials) == len(TESTIMONIALS_DATA) + 1
+    submitted = [testimonial for testimonial in testimonials if "seedKey" not in testimonial]
+    assert [(testimonial["text"], testimonial["isApproved"]) for testimonial in submitted] == [("My own words", False)]
+
+
+def test_testimonials_seeded_without_a_key_are_adopted():
+    async def run():
+        db = create_client("memory://")["test"]
+        legacy = [{key: value for key, value in seed.items() if key != "seedKey"} for seed in TESTIMONIALS_DATA]
+        await db.testimonials.insert_many(legacy)
+        _, diff = await seed_database(db)
+        return diff, await db.testimonials.count_documents({})
+
+    diff, count = asyncio.run(run())
+    assert count == len(TESTIMONIALS_DATA)
+    assert not diff["added"]
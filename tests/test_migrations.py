@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from migrations import ORDER_SCHEMA_VERSION, OrderMigrator, upgrade_order, upgraded_fields
+from resilience import CircuitBreaker
+from storage import create_client
+
+
+def v0_order(number):
+    return {"_id": ObjectId(), "orderId": f"ORDER_{number}", "planId": ObjectId(), "amount": 5.0}
+
+
+def new_migrator(db, owner, batch_size=2):
+    migrator = OrderMigrator(db.orders, db.migrations, batch_size=batch_size)
+    migrator.owner = owner
+    migrator._breaker = CircuitBreaker()
+    return migrator
+
+
+async def versions(db):
+    return {doc["orderId"]: doc.get("schemaVersion", 0) async for doc in db.orders.find({})}
+
+
+def test_v0_order_reads_as_current():
+    stored = v0_order(1)
+    order = upgrade_order(stored)
+    assert order["schemaVersion"] == ORDER_SCHEMA_VERSION == 2
+    assert order["planId"] == str(stored["planId"])
+    assert (order["listPrice"], order["discount"], order["couponCode"]) == (5.0, 0, None)
+    assert isinstance(stored["planId"], ObjectId)
+    assert upgraded_fields(stored, order) == {
+        "planId": order["planId"], "listPrice": 5.0, "discount": 0, "couponCode": None, "schemaVersion": 2
+    }
+    assert upgrade_order(order) is order
+
+
+def test_migration_resumes_where_it_stopped():
+    async def run():
+        db = create_client("memory://")["test"]
+        await db.orders.insert_many([v0_order(number) for number in range(5)])
+        assert not await new_migrator(db, "worker-a").step()
+        # Rewritten in the old schema behind the migrator, so a rescan would find it
+        await db.orders.update_one({"orderId": "ORDER_0"}, {"$set": {"schemaVersion": 0}})
+        # A restarted worker continues from lastId
+        restarted = new_migrator(db, "worker-a")
+        assert not await restarted.step()
+        after_restart = await versions(db)
+        while not await restarted.step():
+            pass
+        return after_restart, await db.migrations.find_one({"_id": "orders"})
+
+    after_restart, progress = asyncio.run(run())
+    assert after_restart == {"ORDER_0": 0, "ORDER_1": 2, "ORDER_2": 2, "ORDER_3": 2, "ORDER_4": 0}
+    assert progress["completedVersion"] == ORDER_SCHEMA_VERSION
+    assert progress["migrated"] == 5
+    assert progress["leaseUntil"] <= datetime.utcnow()
+
+
+def test_second_owner_cannot_take_the_lease():
+    async def run():
+        db = create_client("memory://")["test"]
+        await db.orders.insert_many([v0_order(number) for number in range(5)])
+        holder, other = new_migrator(db, "worker-a"), new_migrator(db, "worker-b")
+        await holder.step()
+        blocked = await other.step()
+        before_expiry = await versions(db)
+        # The holder died; its lease runs out
+        await db.migrations.update_one(
+            {"_id": "orders"}, {"$set": {"leaseUntil": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        await other.step()
+        return blocked, before_expiry, await versions(db), await db.migrations.find_one({"_id": "orders"})
+
+    blocked, before_expiry, after_expiry, progress = asyncio.run(run())
+    assert blocked is False
+    assert sum(version == 2 for version in before_expiry.values()) == 2
+    assert sum(version == 2 for version in after_expiry.values()) == 4
+    assert progress["owner"] == "worker-b"
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import time
+
+from bson import ObjectId, json_util
+
+from resilience import CircuitBreaker, OrderSpool, _write_atomic
+from storage import create_client
+
+
+def write_snapshots(path, writer, count):
+    for index in range(count):
+        _write_atomic(path, json.dumps({"writer": writer, "index": index, "data": ["x" * 64] * 200}))
+
+
+def test_concurrent_snapshot_writers_never_leave_a_torn_file(tmp_path):
+    path = tmp_path / "plans.json"
+    _write_atomic(path, json.dumps({"writer": None}))
+    writers = [multiprocessing.Process(target=write_snapshots, args=(path, writer, 200)) for writer in range(4)]
+    for writer in writers:
+        writer.start()
+    while any(writer.is_alive() for writer in writers):
+        json.loads(path.read_text())
+    assert all(writer.exitcode == 0 for writer in writers)
+    assert json.loads(path.read_text())["index"] == 199
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def new_order(number):
+    return {"_id": ObjectId(), "orderId": f"ORDER_{number}", "amount": 10.0}
+
+
+def memory_orders():
+    return create_client("memory://")["test"]["orders"]
+
+
+async def replay_all(spool, orders):
+    spool.adopt_orphans()
+    await spool.replay(orders, CircuitBreaker())
+    return {doc["orderId"] for doc in await orders.find({}).to_list(length=None)}
+
+
+def append_until_killed(directory, acked_path):
+    # Records each order once append() acknowledged it, like the API would
+    async def run():
+        spool = OrderSpool(directory)
+        acked = os.open(acked_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        number = 0
+        while True:
+            doc = new_order(f"{os.getpid()}_{number}")
+            await spool.append(doc)
+            os.write(acked, (doc["orderId"] + "\n").encode())
+            number += 1
+    asyncio.run(run())
+
+
+def test_no_acknowledged_order_is_lost_when_a_worker_is_killed(tmp_path):
+    acked_path = tmp_path / "acked.txt"
+    for delay in (0.05, 0.2, 0.4):
+        worker = multiprocessing.Process(target=append_until_killed, args=(tmp_path / "log", acked_path))
+        worker.start()
+        time.sleep(delay)
+        os.kill(worker.pid, signal.SIGKILL)
+        worker.join()
+
+    orders = memory_orders()
+    replayed = asyncio.run(replay_all(OrderSpool(tmp_path / "log"), orders))
+    acked = set(acked_path.read_text().split())
+    assert acked
+    assert acked <= replayed
+    assert not list((tmp_path / "log").glob("*.flushing"))
+
+
+def dead_pid():
+    process = multiprocessing.Process(target=int)
+    process.start()
+    process.join()
+    return process.pid
+
+
+def test_torn_record_of_a_dead_worker_does_not_block_replay(tmp_path):
+    logged = [new_order(number) for number in range(3)]
+    lines = "".join(json_util.dumps(doc) + "\n" for doc in logged)
+    # SIGKILLed halfway through its fourth append
+    (tmp_path / f"orders.{dead_pid()}.log").write_text(lines + json_util.dumps(new_order(3))[:25])
+
+    async def run():
+        orders = memory_orders()
+        spool = OrderSpool(tmp_path)
+        spool.adopt_orphans()
+        await spool.append(new_order("own"))
+        first = await replay_all(spool, orders)
+        await spool.append(new_order("later"))
+        return first, await replay_all(spool, orders)
+
+    first, second = asyncio.run(run())
+    assert first == {"ORDER_0", "ORDER_1", "ORDER_2", "ORDER_own"}
+    assert second == first | {"ORDER_later"}
+    assert not list(tmp_path.glob("*.flushing"))
+
+
+def test_partial_write_does_not_swallow_the_next_order(tmp_path):
+    async def run():
+        orders = memory_orders()
+        spool = OrderSpool(tmp_path)
+        # What a write that failed partway leaves behind
+        spool.path.write_text('{"_id": {"$oid": "65')
+        await spool.append(new_order("next"))
+        return await replay_all(spool, orders)
+
+    assert asyncio.run(run()) == {"ORDER_next"}
+    assert len(list(tmp_path.glob("*.rejected"))) == 1
+
+
+def test_replay_after_a_crash_mid_replay_inserts_nothing_twice(tmp_path):
+    async def run():
+        orders = memory_orders()
+        spool = OrderSpool(tmp_path)
+        docs = [new_order(number) for number in range(5)]
+        for doc in docs:
+            await spool.append(doc)
+        # The first two made it into Mongo before the worker died
+        await orders.insert_many([dict(doc) for doc in docs[:2]])
+        replayed = await replay_all(spool, orders)
+        return replayed, await orders.count_documents({})
+
+    replayed, count = asyncio.run(run())
+    assert replayed == {f"ORDER_{number}" for number in range(5)}
+    assert count == 5
@@ -0,0 +1,59 @@
+import search
+from search import SearchIndex
+
+
+def plan(plan_id, name, features=()):
+    return {"id": plan_id, "name": name, "features": list(features)}
+
+
+def test_sync_retokenizes_only_changed_documents(monkeypatch):
+    index = SearchIndex({"plan": {"name": 3, "features": 1}})
+    basic, expert = plan("p1", "Basic Plan", ["Tenses"]), plan("p2", "Expert Plan", ["Interview practice"])
+    index.sync("plan", [basic, expert])
+
+    tokenized = []
+    tokenize = search.tokenize
+    monkeypatch.setattr(search, "tokenize", lambda text: tokenized.append(text) or tokenize(text))
+    # A new snapshot: basic unchanged, expert edited, legend added
+    index.sync("plan", [dict(basic), plan("p2", "Expert Plan", ["Accent training"]), plan("p3", "Legend Plan")])
+    assert sorted(tokenized) == ["Accent training", "Expert Plan", "Legend Plan"]
+    monkeypatch.undo()
+
+    assert index.search("interview") == (0, [])
+    assert [doc["id"] for _, _, doc, _ in index.search("accent")[1]] == ["p2"]
+    # Dropped from the snapshot, dropped from the index
+    index.sync("plan", [basic])
+    assert index.search("legend") == (0, [])
+
+
+def test_name_outranks_feature():
+    index = SearchIndex({"plan": {"name": 3, "features": 1}})
+    index.sync("plan", [plan("p1", "Basic Plan", ["Grammar for speaking"]), plan("p2", "Grammar Plan")])
+    _, hits = index.search("grammar")
+    assert [doc["id"] for _, _, doc, _ in hits] == ["p2", "p1"]
+    assert hits[1][3] == ["Grammar for speaking"]
+
+
+def test_search_endpoint(client):
+    results = client.get("/api/search", params={"q": "interviews"}).json()["data"]["results"]
+    assert [result["data"]["name"] for result in results] == ["Expert Plan"]
+    assert results[0]["matches"] == ["Job interview confidence techniques"]
+
+    results = client.get("/api/search", params={"q": "pronunciation"}).json()["data"]["results"]
+    assert {result["type"] for result in results} == {"plan", "testimonial"}
+    plans = client.get("/api/search", params={"q": "pronunciation", "type": "plan"}).json()["data"]["results"]
+    assert {result["type"] for result in plans} == {"plan"}
+    assert client.get("/api/search", params={"q": "pronunciation", "type": "order"}).status_code == 422
+
+
+def test_search_pages(client):
+    everything = client.get("/api/search", params={"q": "plan", "limit": 50}).json()["data"]
+    total = everything["total"]
+    assert total == len(everything["results"]) > 2
+
+    seen = []
+    for page in range(1, total // 2 + 2):
+        data = client.get("/api/search", params={"q": "plan", "page": page, "limit": 2}).json()["data"]
+        assert (data["total"], data["page"], data["limit"]) == (total, page, 2)
+        seen += [(result["type"], result["data"]["id"]) for result in data["results"]]
+    assert seen == [(result["type"], result["data"]["id"]) for result in everything["results"]]
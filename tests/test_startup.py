@@ -0,0 +1,7 @@
+from check_startup import BUDGET_MS, measure_startup
+
+
+def test_app_builds_within_startup_budget():
+    elapsed_ms, slowest = measure_startup()
+    slowest_imports = ", ".join(f"{name} {ms:.0f} ms" for ms, name in slowest[:5])
+    assert elapsed_ms <= BUDGET_MS, f"startup took {elapsed_ms:.0f} ms; slowest imports: {slowest_imports}"
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import time
+
+import cache
+import server
+from static_export import MANIFEST, StaticPublisher
+
+
+def publisher_for(directory, catalog, keep=5):
+    async def load(name):
+        return catalog[name]
+    directory.mkdir(exist_ok=True)
+    return StaticPublisher(directory, cache.CatalogCache(), load, keep=keep)
+
+
+def read_manifest(directory):
+    return json.loads((directory / MANIFEST).read_text())
+
+
+def test_publish_writes_hashed_files_and_manifest(tmp_path):
+    catalog = {"plans": [{"id": "p1", "name": "Basic Plan"}], "testimonials": []}
+    publisher = publisher_for(tmp_path, catalog)
+
+    assert asyncio.run(publisher.publish())
+    files = read_manifest(tmp_path)["files"]
+    assert set(files) == {"plans", "testimonials"}
+    for name, filename in files.items():
+        assert filename.startswith(f"{name}.") and filename.endswith(".json")
+        assert json.loads((tmp_path / filename).read_text()) == {"success": True, "data": catalog[name]}
+
+    # Nothing changed: the manifest is left alone
+    written = (tmp_path / MANIFEST).stat().st_mtime_ns
+    publisher.notify("plans")
+    assert not asyncio.run(publisher.publish())
+    assert (tmp_path / MANIFEST).stat().st_mtime_ns == written
+
+
+def test_prune_keeps_recent_versions_and_the_current_file(tmp_path):
+    catalog = {"plans": [], "testimonials": []}
+    publisher = publisher_for(tmp_path, catalog, keep=2)
+    for number in range(4):
+        catalog["plans"] = [{"id": f"p{number}"}]
+        publisher.notify("plans")
+        asyncio.run(publisher.publish())
+    assert len(list(tmp_path.glob("plans.*.json"))) == 2
+
+    # The current version can be the oldest file, e.g. after a rollback
+    current = tmp_path / publisher.files["plans"]
+    os.utime(current, (0, 0))
+    for newer in ("plans.0000000000000001.json", "plans.0000000000000002.json"):
+        (tmp_path / newer).write_text("{}")
+    publisher._prune("plans")
+    assert sorted(path.name for path in tmp_path.glob("plans.*.json")) == sorted(
+        [current.name, "plans.0000000000000001.json", "plans.0000000000000002.json"]
+    )
+
+
+def test_testimonial_write_publishes_a_new_version(app_env, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    export_dir = app_env / "static"
+    monkeypatch.setenv("STATIC_EXPORT_DIR", str(export_dir))
+
+    def published():
+        try:
+            return read_manifest(export_dir)["files"]
+        except (OSError, ValueError):
+            return None
+
+    def wait_for(condition, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, "timed out"
+            time.sleep(0.05)
+
+    with TestClient(server.create_app()) as client:
+        wait_for(lambda: published() is not None)
+        before = published()
+
+        async def add_testimonial():
+            await server.db.testimonials.insert_one({
+                "name": "Meera", "location": "Pune, India", "rating": 5, "text": "Clear and practical.",
+                "planName": "Basic Plan", "isApproved": True, "isActive": True
+            })
+            await cache.bump_cache_version(server.db, "testimonials")
+        client.portal.call(add_testimonial)
+
+        wait_for(lambda: published()["testimonials"] != before["testimonials"])
+        after = published()
+        assert after["plans"] == before["plans"]
+        body = json.loads((export_dir / after["testimonials"]).read_text())
+        assert "Meera" in {testimonial["name"] for testimonial in body["data"]}
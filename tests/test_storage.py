@@ -0,0 +1,22 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from storage import create_client
+
+
+def test_documents_come_back_as_motor_returns_them():
+    india = timezone(timedelta(hours=5, minutes=30))
+    starts_at = datetime(2026, 1, 1, 5, 30, 0, 123456, tzinfo=india)
+
+    async def run():
+        coupons = create_client("memory://")["test"]["coupons"]
+        await coupons.insert_one({"_id": "A", "startsAt": starts_at, "planIds": ("p1", "p2")})
+        await coupons.update_one({"_id": "A"}, {"$set": {"endsAt": starts_at + timedelta(days=1)}})
+        stored = await coupons.find_one({"startsAt": starts_at})
+        return stored, await coupons.count_documents({"endsAt": {"$gt": datetime(2026, 1, 1)}})
+
+    stored, later = asyncio.run(run())
+    assert stored["startsAt"] == datetime(2026, 1, 1, 0, 0, 0, 123000)
+    assert stored["endsAt"] == datetime(2026, 1, 2, 0, 0, 0, 123000)
+    assert stored["planIds"] == ["p1", "p2"]
+    assert later == 1
@@ -0,0 +1,68 @@
+import json
+import threading
+
+import pytest
+
+from tracing import ConsoleSpanExporter, Tracer
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+@pytest.mark.parametrize("traceparent", [
+    f"00-{TRACE_ID}-{PARENT_ID}-zz",
+    f"00-{TRACE_ID}-{PARENT_ID}",
+    f"00-{TRACE_ID.upper()}-{PARENT_ID}-01",
+    f"00-{'0' * 32}-{PARENT_ID}-01",
+    f"00-{TRACE_ID}-{PARENT_ID}-01\n",
+    "garbage",
+])
+def test_malformed_traceparent_starts_a_new_trace(traceparent):
+    span = Tracer(ConsoleSpanExporter(), sample_rate=1.0).start_trace("GET /", traceparent)
+    assert span is not None
+    assert span.parent_id is None
+    assert span.trace.trace_id != TRACE_ID
+
+
+def test_traceparent_continues_a_sampled_trace():
+    tracer = Tracer(ConsoleSpanExporter(), sample_rate=0.0)
+    span = tracer.start_trace("GET /", f"00-{TRACE_ID}-{PARENT_ID}-01")
+    assert (span.trace.trace_id, span.parent_id) == (TRACE_ID, PARENT_ID)
+    assert tracer.start_trace("GET /", f"00-{TRACE_ID}-{PARENT_ID}-00") is None
+
+
+def test_request_with_malformed_traceparent(app_env, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import server
+    import tracing
+
+    # create_app() configures the module-wide tracer; restored afterwards
+    monkeypatch.setattr(tracing, "tracer", None)
+    monkeypatch.setenv("TRACING_EXPORTER", str(app_env / "spans.jsonl"))
+    monkeypatch.setenv("TRACE_SAMPLE_RATE", "1.0")
+    with TestClient(server.create_app()) as client:
+        response = client.get("/api/plans", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-zz"})
+    assert response.status_code == 200
+    # Exported by the time the app has shut down
+    spans = [json.loads(line) for line in (app_env / "spans.jsonl").read_text().splitlines()]
+    assert {span["name"] for span in spans} >= {"GET /api/plans", "handler"}
+
+
+def test_traces_are_exported_off_the_calling_thread():
+    class RecordingExporter:
+        def __init__(self):
+            self.threads = []
+
+        def export(self, spans):
+            self.threads.append(threading.current_thread())
+
+    exporter = RecordingExporter()
+    tracer = Tracer(exporter, sample_rate=1.0, max_queued=2)
+    for _ in range(3):
+        tracer.finish_trace(tracer.start_trace("GET /"))
+    assert tracer.dropped == 1
+    tracer.start()
+    tracer.stop()
+    assert len(exporter.threads) == 2
+    assert threading.current_thread() not in exporter.threads